@@ -1,9 +1,64 @@
+import os
+from threading import Thread
 from tkinter import *
 from tkinter import ttk
-from game_state import DeskState, CellState
-from game_tree import GameTree
-from players import AlphaBetaPlayer, DecisionPlayer, PlayerType
+from game_state import DeskState, CellState, get_geometry
+from players import AlphaBetaPlayer, DecisionPlayer, PlayerType, SearchCancelled, SearchEngine
+from search_stats import SearchStats
 from game import Game
+from mcts import MCTSPlayer
+from solver import DATABASE_PATH, PerfectPlayDatabase
+
+
+class SearchWorker(Thread):
+    # Выбор хода бота в отдельном потоке, чтобы окно не замирало на время поиска.
+    # Игрок и позиция принадлежат потоку, пока он не закончится; результат забирает главный поток
+    def __init__(self, player, state: DeskState):
+        super().__init__(daemon=True)
+        self.player = player
+        self.state = state
+        self.result = None
+        # Ошибка поиска передаётся главному потоку, а не принимается за конец партии
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = self.player.choose_next(self.state)
+        except SearchCancelled:
+            pass
+        except Exception as error:
+            self.error = error
+
+    def cancel(self):
+        self.player.cancel()
+        self.join()
+
+
+class PonderWorker(SearchWorker):
+    # Обдумывание ходов человека ботом-соперником, пока человек выбирает ход
+    def run(self):
+        self.player.ponder(self.state)
+
+    def cancel(self):
+        super().cancel()
+        # Обдумывание могло закончиться раньше отмены, тогда флаг сбрасывается здесь
+        self.player.cancelled = False
+
+
+# Как часто (в мс) окно проверяет, закончился ли поиск хода, и показывает его ход
+SEARCH_POLL_INTERVAL = 100
+
+# Раскладка дерева в TreeFrame при масштабе 1: размер узла, ширина на узел самого широкого уровня,
+# высота уровня и подписи оценки
+NODE_SIZE = 40
+NODE_STEP = 50
+LEVEL_HEIGHT = 100
+LEVEL_MARGIN = 10
+LABEL_HEIGHT = 15
+# Размер узла на экране (в пикселях), начиная с которого рисуется доска, рёбра и сам узел
+DETAIL_MIN_SIZE = 20
+EDGE_MIN_SIZE = 8
+GLYPH_MIN_SIZE = 3
 
 
 class StateLocation:
@@ -52,94 +107,184 @@ class StateDisplayFrame(InteractiveFrame):
     def draw_state(self, state: DeskState, r: StateLocation):
         x_diff = r.x1 - r.x0
         y_diff = r.y1 - r.y0
+        cell_width = x_diff / state.size
+        cell_height = y_diff / state.size
 
-        x_borders = [r.x0, r.x0 + x_diff / 4, r.x0 + x_diff / 2, r.x0 + 3 * x_diff / 4, r.x1]
-        y_borders = [r.y0, r.y0 + y_diff / 4, r.y0 + y_diff / 2, r.y0 + 3 * y_diff / 4, r.y1]
-
-        self.canvas.create_line(x_borders[0], y_borders[0], x_borders[0], y_borders[4])
-        self.canvas.create_line(x_borders[1], y_borders[0], x_borders[1], y_borders[4])
-        self.canvas.create_line(x_borders[2], y_borders[0], x_borders[2], y_borders[4])
-        self.canvas.create_line(x_borders[3], y_borders[0], x_borders[3], y_borders[4])
-        self.canvas.create_line(x_borders[4], y_borders[0], x_borders[4], y_borders[4])
-
-        self.canvas.create_line(x_borders[0], y_borders[0], x_borders[4], y_borders[0])
-        self.canvas.create_line(x_borders[0], y_borders[1], x_borders[4], y_borders[1])
-        self.canvas.create_line(x_borders[0], y_borders[2], x_borders[4], y_borders[2])
-        self.canvas.create_line(x_borders[0], y_borders[3], x_borders[4], y_borders[3])
-        self.canvas.create_line(x_borders[0], y_borders[4], x_borders[4], y_borders[4])
+        for i in range(state.size + 1):
+            self.canvas.create_line(r.x0 + i * cell_width, r.y0, r.x0 + i * cell_width, r.y1)
+            self.canvas.create_line(r.x0, r.y0 + i * cell_height, r.x1, r.y0 + i * cell_height)
 
         y_shift = r.y0
         for row in state.matrix:
             x_shift = r.x0
             for el in row:
                 if el == CellState.BLACK:
-                    self.canvas.create_oval(x_shift + 1, y_shift + 1, x_shift + x_diff / 4 - 1,
-                                            y_shift + y_diff / 4 - 1, fill='black')
+                    self.canvas.create_oval(x_shift + 1, y_shift + 1, x_shift + cell_width - 1,
+                                            y_shift + cell_height - 1, fill='black')
                 elif el == CellState.WHITE:
-                    self.canvas.create_oval(x_shift + 1, y_shift + 1, x_shift + x_diff / 4 - 1,
-                                            y_shift + y_diff / 4 - 1)
-                x_shift += x_diff / 4
-            y_shift += y_diff / 4
+                    self.canvas.create_oval(x_shift + 1, y_shift + 1, x_shift + cell_width - 1,
+                                            y_shift + cell_height - 1)
+                x_shift += cell_width
+            y_shift += cell_height
 
 
 class TreeFrame(StateDisplayFrame):
+    # Раскладка дерева считается один раз, а рисуются только узлы, попадающие в окно.
+    # Координаты раскладки не зависят от масштаба: при прокрутке и масштабировании
+    # видимая часть перерисовывается заново
     def __init__(self, container, tree, estimates, choice, *args, **kwargs):
         super().__init__(container, *args, **kwargs)
-        if tree is not None:
-            self.state_locations = [None] * len(tree.nodes)
-            self.draw_tree(tree)
-            self.draw_relations(tree)
-            self.draw_estimates(estimates)
-            self.draw_choice(tree, choice)
-
-    def draw_tree(self, tree: GameTree):
-        max_node_count = tree.get_max_count_on_level()
-        width = max_node_count * 50
-        height = len(tree.count_on_level) * 100
-
-        self.canvas.config(scrollregion=(0, 0, width, height))
-
-        y_shift = 10
-        nodes_to_draw = [tree.root_index]
-        for node_count in tree.count_on_level:
-            if node_count == 0:
+        self.estimates = estimates
+        self.choice = choice
+        self.scale = 1.0
+        self.view_x = 0.0
+        self.view_y = 0.0
+        self.last_x = 0
+        self.last_y = 0
+        self.is_placed = False
+        self.is_redraw_pending = False
+        self.levels = []
+        if tree is not None and tree.root_index >= 0:
+            # Следующий поиск игрока может идти в другом потоке и перестроить дерево (reroot),
+            # поэтому узлы и граф берутся такими, какими они были после хода
+            self.nodes = tree.nodes
+            self.graph = tree.graph
+            self.root_index = tree.root_index
+            self.layout_tree()
+            self.canvas.bind('<Configure>', self.on_configure)
+
+    def layout_tree(self):
+        # Уровень узла - его расстояние от корня, узлы уровня идут в порядке обхода в ширину
+        self.node_levels = {self.root_index: 0}
+        self.node_orders = {self.root_index: 0}
+        self.levels = [[self.root_index]]
+        for level_nodes in self.levels:
+            next_level = []
+            for node in level_nodes:
+                for related_node in self.graph.get_related_nodes(node):
+                    if related_node not in self.node_levels:
+                        self.node_levels[related_node] = len(self.levels)
+                        self.node_orders[related_node] = len(next_level)
+                        next_level.append(related_node)
+            if len(next_level) == 0:
                 break
-            x_margin = (width / node_count - 40) / 2
-            x_shift = x_margin
-
-            for i in range(node_count):
-                node = nodes_to_draw.pop(0)
-                location = StateLocation(x_shift, y_shift, x_shift + 40, y_shift + 40)
-                self.draw_state(tree.nodes[node], location)
-                self.state_locations[node] = location
-                x_shift += 2 * x_margin + 40
-                related_nodes = tree.graph.get_related_nodes(node)
-                for related_node in related_nodes:
-                    if related_node not in nodes_to_draw:
-                        nodes_to_draw.append(related_node)
-            y_shift += 100
-
-    def draw_relations(self, tree: GameTree):
-        for i in range(len(tree.nodes)):
-            related_nodes = tree.graph.get_related_nodes(i)
-
-            parent_location = self.state_locations[i]
-            x0, y0 = parent_location.get_out_coord()
-
-            for node in related_nodes:
-                child_location = self.state_locations[node]
-                x1, y1 = child_location.get_in_coord()
-                self.canvas.create_line(x0, y0, x1, y1)
-
-    def draw_estimates(self, estimates):
-        for i in range(len(estimates)):
-            x, y = self.state_locations[i].get_label_coord()
-            self.canvas.create_text(x, y, fill="red", text=estimates[i])
-
-    def draw_choice(self, tree, choice):
-        parent_location = self.state_locations[tree.root_index]
+            self.levels.append(next_level)
+        self.width = max(len(level_nodes) for level_nodes in self.levels) * NODE_STEP
+
+    def get_location(self, node):
+        # Положение узла на экране с учётом масштаба и прокрутки
+        step = self.width / len(self.levels[self.node_levels[node]])
+        x0 = (self.node_orders[node] * step + (step - NODE_SIZE) / 2) * self.scale - self.view_x
+        y0 = (LEVEL_MARGIN + self.node_levels[node] * LEVEL_HEIGHT) * self.scale - self.view_y
+        size = NODE_SIZE * self.scale
+        return StateLocation(x0, y0, x0 + size, y0 + size)
+
+    def get_visible_range(self, level):
+        # Отрезок номеров видимых узлов уровня; узлы уровня стоят с равным шагом
+        view_width = self.canvas.winfo_width()
+        view_height = self.canvas.winfo_height()
+        y0 = (LEVEL_MARGIN + level * LEVEL_HEIGHT) * self.scale - self.view_y
+        if y0 > view_height or y0 + (NODE_SIZE + LABEL_HEIGHT) * self.scale < 0:
+            return range(0)
+        count = len(self.levels[level])
+        step = self.width / count * self.scale
+        margin = (step - NODE_SIZE * self.scale) / 2
+        first = max(0, int((self.view_x - margin - NODE_SIZE * self.scale) // step))
+        last = min(count - 1, int((self.view_x + view_width - margin) // step))
+        return range(first, last + 1)
+
+    def on_configure(self, event):
+        if not self.is_placed:
+            # Вначале корень - посередине окна сверху
+            self.is_placed = True
+            self.view_x = self.width / 2 - event.width / 2
+        self.schedule_redraw()
+
+    def zoom(self, event):
+        factor = 1.001 ** event.delta
+        # Точка под курсором остаётся на месте
+        self.view_x = (self.view_x + event.x) * factor - event.x
+        self.view_y = (self.view_y + event.y) * factor - event.y
+        self.scale *= factor
+        self.schedule_redraw()
+
+    def scan_mark(self, event):
+        self.last_x = event.x
+        self.last_y = event.y
+
+    def scan_drag(self, event):
+        self.view_x -= event.x - self.last_x
+        self.view_y -= event.y - self.last_y
+        self.last_x = event.x
+        self.last_y = event.y
+        self.schedule_redraw()
+
+    def schedule_redraw(self):
+        # Несколько событий подряд (прокрутка колесом, перетаскивание) дают одну перерисовку
+        if not self.is_redraw_pending:
+            self.is_redraw_pending = True
+            self.after_idle(self.redraw)
+
+    def redraw(self):
+        self.is_redraw_pending = False
+        self.canvas.delete('all')
+        size = NODE_SIZE * self.scale
+        if size < GLYPH_MIN_SIZE:
+            self.draw_level_outlines()
+            return
+
+        visible_nodes = []
+        for level in range(len(self.levels)):
+            for order in self.get_visible_range(level):
+                visible_nodes.append(self.levels[level][order])
+        if size >= EDGE_MIN_SIZE:
+            self.draw_relations(visible_nodes)
+        for node in visible_nodes:
+            location = self.get_location(node)
+            if size >= DETAIL_MIN_SIZE:
+                self.draw_state(self.nodes[node], location)
+                if node < len(self.estimates):
+                    x, y = location.get_label_coord()
+                    self.canvas.create_text(x, y, fill="red", text=self.estimates[node])
+            else:
+                self.draw_glyph(self.nodes[node], location)
+        self.draw_choice()
+
+    def draw_glyph(self, state: DeskState, r: StateLocation):
+        # Мелкий узел - один прямоугольник, тем темнее, чем больше на доске чёрных фишек
+        black_count, white_count, empty_count = state.get_cell_state_distribution()
+        shade = 255 - 255 * black_count // max(1, black_count + white_count)
+        self.canvas.create_rectangle(r.x0, r.y0, r.x1, r.y1, fill='#%02x%02x%02x' % (shade, shade, shade))
+
+    def draw_level_outlines(self):
+        # При очень мелком масштабе уровень рисуется одной полосой во всю его ширину
+        for level, level_nodes in enumerate(self.levels):
+            first = self.get_location(level_nodes[0])
+            last = self.get_location(level_nodes[-1])
+            self.canvas.create_rectangle(first.x0, first.y0, last.x1, last.y1 + 1, fill='grey', outline='')
+
+    def draw_relations(self, visible_nodes):
+        # Рёбра видимых узлов: к потомкам и к невидимым родителям (ребро видимых родителей рисует он сам)
+        visible = set(visible_nodes)
+        for node in visible_nodes:
+            location = self.get_location(node)
+            x0, y0 = location.get_out_coord()
+            for related_node in self.graph.get_related_nodes(node):
+                if related_node in self.node_levels:
+                    x1, y1 = self.get_location(related_node).get_in_coord()
+                    self.canvas.create_line(x0, y0, x1, y1)
+            x1, y1 = location.get_in_coord()
+            for parent_node in self.graph.get_parent_nodes(node):
+                if parent_node not in visible and parent_node in self.node_levels:
+                    x0, y0 = self.get_location(parent_node).get_out_coord()
+                    self.canvas.create_line(x0, y0, x1, y1)
+
+    def draw_choice(self):
+        if self.choice is None or self.choice not in self.node_levels:
+            return
+        parent_location = self.get_location(self.root_index)
         x0, y0 = parent_location.get_out_coord()
-        child_location = self.state_locations[choice]
+        child_location = self.get_location(self.choice)
         x1, y1 = child_location.get_in_coord()
         self.canvas.create_line(x0, y0, x1, y1, fill="red", width=3)
         self.canvas.create_rectangle(child_location.x0, child_location.y0, child_location.x1, child_location.y1,
@@ -155,6 +300,8 @@ class PlayerInfoFrame(Frame):
             self.top_frame.pack(side=TOP, fill=Y, expand=True, padx=5)
             self.label1 = Label(self.top_frame, text='Pirmais spēlētājs (melns)', font=('Segoe', '12', 'bold'))
             self.label1.pack(side=TOP)
+            self.stats_label1 = Label(self.top_frame, text='', font=('Segoe', '9'), justify=LEFT)
+            self.stats_label1.pack(side=TOP)
             self.frame1 = TreeFrame(self.top_frame, None, None, None, *args, **kwargs)
             self.frame1.pack(side=BOTTOM, fill=Y, expand=True, padx=5)
         if self.game.second_player.player_type == PlayerType.ALPHA_BETA_BOT:
@@ -162,6 +309,8 @@ class PlayerInfoFrame(Frame):
             self.bottom_frame.pack(side=BOTTOM, fill=Y, expand=True, padx=5)
             self.label2 = Label(self.bottom_frame, text='Otrais spēlētājs (balts)', font=('Segoe', '12', 'bold'))
             self.label2.pack(side=TOP)
+            self.stats_label2 = Label(self.bottom_frame, text='', font=('Segoe', '9'), justify=LEFT)
+            self.stats_label2.pack(side=TOP)
             self.frame2 = TreeFrame(self.bottom_frame, None, None, None, *args, **kwargs)
             self.frame2.pack(side=BOTTOM, fill=Y, expand=True, padx=5)
 
@@ -171,11 +320,13 @@ class PlayerInfoFrame(Frame):
             self.frame1.destroy()
             self.frame1 = TreeFrame(self.top_frame, None, None, None)
             self.frame1.pack(side=TOP, fill=Y, expand=True, padx=5)
+            self.stats_label1['text'] = ''
         if self.game.second_player.player_type == PlayerType.ALPHA_BETA_BOT:
             self.frame2.pack_forget()
             self.frame2.destroy()
             self.frame2 = TreeFrame(self.bottom_frame, None, None, None)
             self.frame2.pack(side=BOTTOM, fill=Y, expand=True, padx=5)
+            self.stats_label2['text'] = ''
 
     def update(self):
         # Только что походил "черный" игрок
@@ -189,6 +340,7 @@ class PlayerInfoFrame(Frame):
                 self.game.first_player.player_choice
             )
             self.frame1.pack(side=TOP, fill=Y, expand=True)
+            self.stats_label1['text'] = self.format_stats(self.game.first_player.stats)
         # Только что походил "белый" игрок
         elif self.game.second_player.player_type == PlayerType.ALPHA_BETA_BOT:
             self.frame2.pack_forget()
@@ -200,6 +352,17 @@ class PlayerInfoFrame(Frame):
                 self.game.second_player.player_choice
             )
             self.frame2.pack(side=BOTTOM, fill=Y, expand=True)
+            self.stats_label2['text'] = self.format_stats(self.game.second_player.stats)
+
+    @staticmethod
+    def format_stats(stats: SearchStats):
+        cutoffs = ' '.join('{}:{}'.format(depth, count) for depth, count in sorted(stats.cutoffs.items()))
+        return 'Dziļums {}, mezgli: izveidoti {}, apmeklēti {}, lapas {}\n' \
+               'Nogriešanas {} ({}), EBF {:.2f}\n' \
+               'Koka būve {:.0f} ms, novērtēšana {:.0f} ms'.format(
+                   stats.depth, stats.nodes_generated, stats.nodes_visited, stats.leaves,
+                   stats.get_cutoff_count(), cutoffs, stats.get_effective_branching_factor(),
+                   stats.build_time * 1000, stats.get_evaluation_time() * 1000)
 
 
 class MessageFrame(Frame):
@@ -248,73 +411,85 @@ class ControlFrame(Frame):
 
 
 class DeskFrame(StateDisplayFrame):
+    # Сетка, фишки и кнопки ходов создаются один раз на размер доски. Обновление сравнивает
+    # показанную позицию с новой и меняет только клетки, где фишка или кнопка хода изменилась
     def __init__(self, container, game, *args, **kwargs):
         super().__init__(container, *args, **kwargs)
         self.game = game
         self.player_decision = None
+        self.board_size = None
+        # Элементы холста по номеру клетки (y * size + x)
+        self.disc_items = []
+        self.decision_items = []
+        # Показанная позиция: маски фишек и клетки кнопок ходов (клетка -> выбрана ли она)
+        self.shown_black = 0
+        self.shown_white = 0
+        self.shown_decisions = {}
         self.update()
 
-    def update(self):
-        if self.game.current_state is not None:
-            self.canvas.delete('all')
-            self.draw_state(self.game.current_state, StateLocation(100, 100, 500, 500))
-            if self.game.is_person_next():
-                self.create_decision_buttons()
-
-    def create_decision_buttons(self):
-        for coord, directions in self.game.allowed_steps_for_person:
-            if self.player_decision is not None and self.player_decision[0] == coord:
-                decision_button = self.canvas.create_oval(
-                    (coord.x + 1) * 100,
-                    (coord.y + 1) * 100,
-                    (coord.x + 2) * 100,
-                    (coord.y + 2) * 100,
-                    fill="green"
-                )
-            else:
-                decision_button = self.canvas.create_oval(
-                    (coord.x + 1) * 100,
-                    (coord.y + 1) * 100,
-                    (coord.x + 2) * 100,
-                    (coord.y + 2) * 100,
-                    fill="grey",
-                    activeoutline="green",
-                    activewidth=5
-                )
-
-            function = self.__get_func_for_coord(coord.x, coord.y)
+    def create_board(self, size: int):
+        self.canvas.delete('all')
+        self.board_size = size
+        self.disc_items = []
+        self.decision_items = []
+        self.shown_black = 0
+        self.shown_white = 0
+        self.shown_decisions = {}
+
+        cell_size = 400 / size
+        for i in range(size + 1):
+            self.canvas.create_line(100 + i * cell_size, 100, 100 + i * cell_size, 500)
+            self.canvas.create_line(100, 100 + i * cell_size, 500, 100 + i * cell_size)
+        for index in range(size * size):
+            x0 = 100 + index % size * cell_size
+            y0 = 100 + index // size * cell_size
+            self.disc_items.append(self.canvas.create_oval(
+                x0 + 1, y0 + 1, x0 + cell_size - 1, y0 + cell_size - 1, state=HIDDEN))
+            decision_button = self.canvas.create_oval(x0, y0, x0 + cell_size, y0 + cell_size, state=HIDDEN)
             self.canvas.tag_bind(
                 decision_button,
                 '<Button-1>',
-                function
+                lambda event, x=index % size, y=index // size: self.on_decision_click(x, y)
             )
+            self.decision_items.append(decision_button)
 
-    # Вынужденный колхоз
-    def __get_func_for_coord(self, x, y):
-        if x == 0 and y == 0:
-            return lambda event: self.on_decision_click00()
-        if x == 1 and y == 0:
-            return lambda event: self.on_decision_click10()
-        if x == 2 and y == 0:
-            return lambda event: self.on_decision_click20()
-        if x == 3 and y == 0:
-            return lambda event: self.on_decision_click30()
-        if x == 0 and y == 1:
-            return lambda event: self.on_decision_click01()
-        if x == 3 and y == 1:
-            return lambda event: self.on_decision_click31()
-        if x == 0 and y == 2:
-            return lambda event: self.on_decision_click02()
-        if x == 3 and y == 2:
-            return lambda event: self.on_decision_click32()
-        if x == 0 and y == 3:
-            return lambda event: self.on_decision_click03()
-        if x == 1 and y == 3:
-            return lambda event: self.on_decision_click13()
-        if x == 2 and y == 3:
-            return lambda event: self.on_decision_click23()
-        if x == 3 and y == 3:
-            return lambda event: self.on_decision_click33()
+    def update(self):
+        state = self.game.current_state
+        if state is None:
+            return
+        if state.size != self.board_size:
+            self.create_board(state.size)
+
+        changed = (self.shown_black ^ state.black) | (self.shown_white ^ state.white)
+        while changed:
+            square = changed & -changed
+            changed ^= square
+            disc_item = self.disc_items[square.bit_length() - 1]
+            if state.black & square:
+                self.canvas.itemconfigure(disc_item, state=NORMAL, fill='black')
+            elif state.white & square:
+                self.canvas.itemconfigure(disc_item, state=NORMAL, fill='')
+            else:
+                self.canvas.itemconfigure(disc_item, state=HIDDEN)
+        self.shown_black = state.black
+        self.shown_white = state.white
+
+        decisions = {}
+        if self.game.is_person_next():
+            geometry = get_geometry(state.size)
+            for coord, directions in self.game.allowed_steps_for_person:
+                is_chosen = self.player_decision is not None and self.player_decision[0] == coord
+                decisions[geometry.get_square(coord)] = is_chosen
+        for square in self.shown_decisions.keys() - decisions.keys():
+            self.canvas.itemconfigure(self.decision_items[square.bit_length() - 1], state=HIDDEN)
+        for square, is_chosen in decisions.items():
+            if self.shown_decisions.get(square) != is_chosen:
+                decision_button = self.decision_items[square.bit_length() - 1]
+                if is_chosen:
+                    self.canvas.itemconfigure(decision_button, state=NORMAL, fill='green', activeoutline='', activewidth=0)
+                else:
+                    self.canvas.itemconfigure(decision_button, state=NORMAL, fill='grey', activeoutline='green', activewidth=5)
+        self.shown_decisions = decisions
 
     def on_decision_click(self, x, y):
         for allowed in self.game.allowed_steps_for_person:
@@ -323,58 +498,28 @@ class DeskFrame(StateDisplayFrame):
                 break
         self.update()
 
-    def on_decision_click00(self):
-        self.on_decision_click(0, 0)
-
-    def on_decision_click10(self):
-        self.on_decision_click(1, 0)
-
-    def on_decision_click20(self):
-        self.on_decision_click(2, 0)
-
-    def on_decision_click30(self):
-        self.on_decision_click(3, 0)
-
-    def on_decision_click01(self):
-        self.on_decision_click(0, 1)
-
-    def on_decision_click31(self):
-        self.on_decision_click(3, 1)
-
-    def on_decision_click02(self):
-        self.on_decision_click(0, 2)
-
-    def on_decision_click32(self):
-        self.on_decision_click(3, 2)
-
-    def on_decision_click03(self):
-        self.on_decision_click(0, 3)
-
-    def on_decision_click13(self):
-        self.on_decision_click(1, 3)
-
-    def on_decision_click23(self):
-        self.on_decision_click(2, 3)
-
-    def on_decision_click33(self):
-        self.on_decision_click(3, 3)
-
 
 class PlayerChoiceWindow(Toplevel):
     def __init__(self, parent):
         super().__init__(parent)
         self.title('Izvēlieties spēlētājus')
-        self.geometry("300x200")
+        self.geometry("300x300")
         option_frame = Frame(self)
         option_frame.pack(side=TOP, expand=True, fill=BOTH)
 
+        variants = ['Manuāli', 'Alfa-Beta-1', 'Alfa-Beta-2', 'Alfa-Beta-3', 'Alfa-Beta-4', 'Alfa-Beta-5',
+                    'Alfa-Beta-1s', 'Alfa-Beta-5s', 'PVS-5', 'PVS-5s', 'MTD(f)-5', 'MTD(f)-5s', 'MCTS-1s', 'MCTS-5s']
+        # Идеальная игра доступна, только если база построена (python solver.py)
+        if os.path.exists(DATABASE_PATH):
+            variants.append('Ideāla spēle')
+
         Label(option_frame, text='Pirmais spēlētājs', font=('Segoe', '14')).pack(side=TOP, fill=X, padx=5, pady=5)
         variant1 = StringVar()
         variant1.set('Manuāli')
         player_combobox1 = ttk.Combobox(
             option_frame,
             textvariable=variant1,
-            values=('Manuāli', 'Alfa-Beta-1', 'Alfa-Beta-2', 'Alfa-Beta-3', 'Alfa-Beta-4', 'Alfa-Beta-5')
+            values=variants
         )
         player_combobox1.pack(side=TOP, fill=X, padx=5, pady=5)
 
@@ -384,10 +529,36 @@ class PlayerChoiceWindow(Toplevel):
         player_combobox2 = ttk.Combobox(
             option_frame,
             textvariable=variant2,
-            values=('Manuāli', 'Alfa-Beta-1', 'Alfa-Beta-2', 'Alfa-Beta-3', 'Alfa-Beta-4', 'Alfa-Beta-5')
+            values=variants
         )
         player_combobox2.pack(side=TOP, fill=X, padx=5, pady=5)
 
+        Label(option_frame, text='Laukuma izmērs', font=('Segoe', '14')).pack(side=TOP, fill=X, padx=5, pady=5)
+        self.board_size = StringVar()
+        self.board_size.set('4x4')
+        ttk.Combobox(
+            option_frame,
+            textvariable=self.board_size,
+            values=('4x4', '6x6', '8x8')
+        ).pack(side=TOP, fill=X, padx=5, pady=5)
+
+        self.full_tree = BooleanVar()
+        self.full_tree.set(False)
+        Checkbutton(
+            option_frame,
+            text='Rādīt pilnu koku',
+            variable=self.full_tree
+        ).pack(side=TOP, padx=5)
+
+        # Позиционная оценка листьев (углы, края, подвижность) вместо разности фишек
+        self.use_patterns = BooleanVar()
+        self.use_patterns.set(False)
+        Checkbutton(
+            option_frame,
+            text='Pozicionālais novērtējums',
+            variable=self.use_patterns
+        ).pack(side=TOP, padx=5)
+
         ok_button = Button(
             self,
             text='Ok',
@@ -397,6 +568,7 @@ class PlayerChoiceWindow(Toplevel):
             bg='#111B69',
             relief='flat',
             command=lambda: [
+                parent.set_board_size(self.get_board_size()),
                 parent.set_players(self.create_player(variant1.get(), CellState.BLACK),
                                    self.create_player(variant2.get(), CellState.WHITE)),
                 self.destroy()
@@ -405,19 +577,55 @@ class PlayerChoiceWindow(Toplevel):
         ok_button.pack(side=BOTTOM, fill=X, padx=5, pady=5)
         self.bind('<Return>', lambda e: ok_button.invoke())
 
+    def get_board_size(self):
+        return int(self.board_size.get().split('x')[0])
+
     def create_player(self, variant, applied_cell_state):
         if variant == 'Manuāli':
             return DecisionPlayer(applied_cell_state, self.master.get_player_decision)
         if variant == 'Alfa-Beta-1':
-            return AlphaBetaPlayer(applied_cell_state, 1)
+            return AlphaBetaPlayer(applied_cell_state, 1, self.full_tree.get(), use_patterns=self.use_patterns.get())
         if variant == 'Alfa-Beta-2':
-            return AlphaBetaPlayer(applied_cell_state, 2)
+            return AlphaBetaPlayer(applied_cell_state, 2, self.full_tree.get(), use_patterns=self.use_patterns.get())
         if variant == 'Alfa-Beta-3':
-            return AlphaBetaPlayer(applied_cell_state, 3)
+            return AlphaBetaPlayer(applied_cell_state, 3, self.full_tree.get(), use_patterns=self.use_patterns.get())
         if variant == 'Alfa-Beta-4':
-            return AlphaBetaPlayer(applied_cell_state, 4)
+            return AlphaBetaPlayer(applied_cell_state, 4, self.full_tree.get(), use_patterns=self.use_patterns.get())
         if variant == 'Alfa-Beta-5':
-            return AlphaBetaPlayer(applied_cell_state, 5)
+            return AlphaBetaPlayer(applied_cell_state, 5, self.full_tree.get(), use_patterns=self.use_patterns.get())
+        # Поиск с ограничением времени на ход, глубина ограничена числом клеток доски
+        cell_count = self.get_board_size() ** 2
+        if variant == 'Alfa-Beta-1s':
+            return AlphaBetaPlayer(applied_cell_state, cell_count, self.full_tree.get(),
+                                   use_patterns=self.use_patterns.get(), time_limit=1)
+        if variant == 'Alfa-Beta-5s':
+            return AlphaBetaPlayer(applied_cell_state, cell_count, self.full_tree.get(),
+                                   use_patterns=self.use_patterns.get(), time_limit=5)
+        # Другие алгоритмы поиска с той же оценкой позиций
+        if variant == 'PVS-5':
+            return AlphaBetaPlayer(applied_cell_state, 5, self.full_tree.get(),
+                                   use_patterns=self.use_patterns.get(), engine=SearchEngine.PVS)
+        if variant == 'PVS-5s':
+            return AlphaBetaPlayer(applied_cell_state, cell_count, self.full_tree.get(),
+                                   use_patterns=self.use_patterns.get(), time_limit=5,
+                                   engine=SearchEngine.PVS)
+        if variant == 'MTD(f)-5':
+            return AlphaBetaPlayer(applied_cell_state, 5, self.full_tree.get(),
+                                   use_patterns=self.use_patterns.get(), engine=SearchEngine.MTDF)
+        if variant == 'MTD(f)-5s':
+            return AlphaBetaPlayer(applied_cell_state, cell_count, self.full_tree.get(),
+                                   use_patterns=self.use_patterns.get(), time_limit=5,
+                                   engine=SearchEngine.MTDF)
+        # Поиск Монте-Карло: случайные партии вместо полного перебора, годится для больших досок
+        if variant == 'MCTS-1s':
+            return MCTSPlayer(applied_cell_state, time_limit=1)
+        if variant == 'MCTS-5s':
+            return MCTSPlayer(applied_cell_state, time_limit=5)
+        # Позиции, которых нет в базе (другой размер доски), просчитываются как Alfa-Beta-5s
+        if variant == 'Ideāla spēle':
+            return AlphaBetaPlayer(applied_cell_state, cell_count, self.full_tree.get(),
+                                   use_patterns=self.use_patterns.get(), time_limit=5,
+                                   database=PerfectPlayDatabase(DATABASE_PATH))
 
 
 class App(Tk):
@@ -430,7 +638,7 @@ class App(Tk):
         choice_window.attributes('-topmost', 'true')
         self.wait_window(choice_window)
 
-        self.game = Game(self.player1, self.player2)
+        self.game = Game(self.player1, self.player2, self.board_size)
 
         central_frame = Frame(self)
         central_frame.pack(side=LEFT, fill=BOTH, expand=True)
@@ -453,6 +661,14 @@ class App(Tk):
         self.control_frame = ControlFrame(right_frame, self.update, self.retry)
         self.control_frame.pack(side=BOTTOM, fill=X, padx=0, pady=0)
 
+        self.search_worker = None
+        self.ponder_worker = None
+        self.protocol('WM_DELETE_WINDOW', self.close)
+        self.start_pondering()
+
+    def set_board_size(self, board_size):
+        self.board_size = board_size
+
     def set_players(self, player1, player2):
         self.player1 = player1
         self.player2 = player2
@@ -466,32 +682,98 @@ class App(Tk):
             if self.desk_frame.player_decision is None and len(self.game.allowed_steps_for_person) > 0:
                 self.message_frame.new_warning('Ir jāizvēlas nākamais gājiens')
             else:
+                self.stop_pondering()
                 self.game.next()
+                self.desk_frame.player_decision = None
+                self.start_pondering()
 
                 self.desk_frame.update()
                 self.player_info_frame.update()
                 self.message_frame.clear()
-                self.desk_frame.player_decision = None
+        elif self.search_worker is None:
+            self.search_worker = SearchWorker(self.game.get_next_player(), self.game.current_state)
+            self.search_worker.start()
+            self.control_frame.next_button['state'] = DISABLED
+            self.message_frame.new_message('Notiek gājiena meklēšana...')
+            self.after(SEARCH_POLL_INTERVAL, self.poll_search, self.search_worker)
+            return
+
+        self.update_player_label()
+
+    def poll_search(self, worker: SearchWorker):
+        # Поиск уже отменён (Atkārtot), его результат не нужен
+        if worker is not self.search_worker:
+            return
+        if worker.is_alive():
+            if worker.player.player_type == PlayerType.MCTS_BOT:
+                self.message_frame.new_message('Notiek gājiena meklēšana: izspēles {}'.format(worker.player.playouts))
+            else:
+                stats = worker.player.stats
+                self.message_frame.new_message('Notiek gājiena meklēšana: dziļums {}, mezgli {}'.format(
+                    stats.depth, stats.nodes_visited))
+            self.after(SEARCH_POLL_INTERVAL, self.poll_search, worker)
+            return
+
+        self.search_worker = None
+        self.control_frame.next_button['state'] = NORMAL
+        if worker.error is not None:
+            self.message_frame.new_warning('Kļūda gājiena meklēšanā: {}'.format(worker.error))
+            return
+        self.game.apply(worker.result)
+        if self.game.is_finished:
+            self.message_frame.new_message('Spēle pabeigta')
+            return
+        self.desk_frame.update()
+        self.player_info_frame.update()
+        if worker.player.player_type == PlayerType.MCTS_BOT and worker.player.win_rate is not None:
+            self.message_frame.new_message('Izspēles {}, {:.0f} sekundē, uzvaras iespēja {:.0f}%'.format(
+                worker.player.playouts, worker.player.playouts_per_second, worker.player.win_rate * 100))
         else:
-            self.game.next()
-            if self.game.is_finished:
-                self.message_frame.new_message('Spēle pabeigta')
-                return
-            self.desk_frame.update()
-            self.player_info_frame.update()
             self.message_frame.clear()
-
+        self.update_player_label()
+        self.start_pondering()
+
+    def start_pondering(self):
+        # Пока ходит человек, бот-соперник просчитывает его возможные ходы
+        opponent = self.game.get_waiting_player()
+        if not self.game.is_finished and self.game.is_person_next() and \
+                opponent.player_type == PlayerType.ALPHA_BETA_BOT:
+            self.ponder_worker = PonderWorker(opponent, self.game.current_state)
+            self.ponder_worker.start()
+
+    def stop_pondering(self):
+        if self.ponder_worker is not None:
+            self.ponder_worker.cancel()
+            self.ponder_worker = None
+
+    def update_player_label(self):
         if self.game.next_cell_state_to_apply == CellState.BLACK:
             self.curr_player_label['text'] = 'Tagad lēmumu pieņem pirmais spēlētājs'
         else:
             self.curr_player_label['text'] = 'Tagad lēmumu pieņem otrais spēlētājs'
 
+    def cancel_search(self):
+        if self.search_worker is not None:
+            self.search_worker.cancel()
+            self.search_worker = None
+            self.control_frame.next_button['state'] = NORMAL
+
     def retry(self):
+        self.cancel_search()
+        self.stop_pondering()
         self.player1.retry()
         self.player2.retry()
         self.game.new_game(self.player1, self.player2)
         self.desk_frame.update()
         self.player_info_frame.clear()
+        self.message_frame.clear()
+        self.update_player_label()
+        self.start_pondering()
+
+    def close(self):
+        self.cancel_search()
+        self.stop_pondering()
+        self.destroy()
 
     def get_player_decision(self):
         return self.desk_frame.player_decision
@@ -0,0 +1,232 @@
+import numpy as np
+from game_state import CellState, DeskState, get_geometry
+from search_stats import SearchStats
+
+# Пакетный режим: много позиций одного размера обрабатываются как массивы NumPy, без обхода
+# позиций по одной в интерпретаторе. Доска до 8x8 помещается в uint64
+
+# Число единичных битов в байте - для NumPy 1.x, где нет np.bitwise_count
+_BYTE_BIT_COUNTS = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+
+def count_bits(values):
+    # Число фишек в каждой маске массива uint64
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    return _BYTE_BIT_COUNTS[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+class BoardBatch:
+    def __init__(self, size: int, black, white, white_next, passed):
+        if size * size > 64:
+            raise ValueError('Board batches support boards up to 8x8')
+        self.size = size
+        self.black = black
+        self.white = white
+        # Очередь хода белых и пропуск хода в предыдущей позиции, как passed_last_move у DeskState
+        self.white_next = white_next
+        self.passed = passed
+
+    @staticmethod
+    def from_states(states: list[DeskState]):
+        return BoardBatch(
+            states[0].size,
+            np.array([state.black for state in states], dtype=np.uint64),
+            np.array([state.white for state in states], dtype=np.uint64),
+            np.array([state.next_cell_state == CellState.WHITE for state in states], dtype=bool),
+            np.array([state.passed_last_move for state in states], dtype=bool)
+        )
+
+    def __len__(self):
+        return len(self.black)
+
+    def to_states(self):
+        geometry = get_geometry(self.size)
+        states = []
+        for black, white, white_next, passed in zip(self.black, self.white, self.white_next, self.passed):
+            state = DeskState(True, size=self.size)
+            state.black = int(black)
+            state.white = int(white)
+            state.black_count = state.black.bit_count()
+            state.white_count = state.white.bit_count()
+            state.next_cell_state = CellState.WHITE if white_next else CellState.BLACK
+            state.last_cell_state = state.next_cell_state.get_opposite()
+            state.passed_last_move = bool(passed)
+            state.hash = geometry.get_zobrist_hash(state.black, state.white, state.next_cell_state)
+            states.append(state)
+        return states
+
+    def get_sides(self):
+        own = np.where(self.white_next, self.white, self.black)
+        opponent = np.where(self.white_next, self.black, self.white)
+        return own, opponent
+
+    def get_moves(self, own, opponent):
+        # Те же сдвиги масок, что и в BoardGeometry.get_moves, но для всех досок сразу
+        geometry = get_geometry(self.size)
+        empty = ~(own | opponent) & np.uint64(geometry.full_mask)
+        moves = np.zeros(len(own), dtype=np.uint64)
+        for shift, delta, mask in _get_shifts(geometry):
+            closable = mask & opponent
+            line = shift(own, delta) & closable
+            for i in range(geometry.max_line_length - 1):
+                line |= shift(line, delta) & closable
+            moves |= shift(line, delta) & mask & empty
+        return moves
+
+    def get_flips(self, own, opponent, moves):
+        # Фишки, переворачиваемые ходом в клетку moves (по одной клетке на доску)
+        geometry = get_geometry(self.size)
+        flips = np.zeros(len(moves), dtype=np.uint64)
+        for shift, delta, mask in _get_shifts(geometry):
+            line = shift(moves, delta) & mask & opponent
+            for i in range(geometry.max_line_length - 1):
+                line |= shift(line, delta) & mask & opponent
+            # За последней фишкой противника в линии должна стоять своя фишка
+            is_closed = (shift(line, delta) & mask & own) != 0
+            flips |= np.where(is_closed, line, np.uint64(0))
+        return flips
+
+    def get_disc_difference(self, white_perspective):
+        difference = count_bits(self.black).astype(np.int64) - count_bits(self.white).astype(np.int64)
+        return np.where(white_perspective, -difference, difference)
+
+    def expand(self, include_final: bool = False):
+        # Все позиции после одного хода: (индексы родителей, позиции, клетки ходов; 0 - пропуск хода).
+        # Как и в GameTree, пропуск хода, после которого ходить некому, не создаётся;
+        # include_final создаёт его, как DeskState.get_following_states
+        own, opponent = self.get_sides()
+        moves = self.get_moves(own, opponent)
+        parents = []
+        children = []
+        squares = []
+
+        remaining = moves.copy()
+        indexes = np.nonzero(remaining)[0]
+        while len(indexes) > 0:
+            square = remaining[indexes] & (~remaining[indexes] + np.uint64(1))
+            flips = self.get_flips(own[indexes], opponent[indexes], square)
+            new_own = own[indexes] | square | flips
+            new_opponent = opponent[indexes] & ~flips
+            white_next = self.white_next[indexes]
+            parents.append(indexes)
+            children.append((
+                np.where(white_next, new_opponent, new_own),
+                np.where(white_next, new_own, new_opponent),
+                ~white_next,
+                np.zeros(len(indexes), dtype=bool)
+            ))
+            squares.append(square)
+            remaining[indexes] ^= square
+            indexes = np.nonzero(remaining)[0]
+
+        passing = np.nonzero((moves == 0) & ~self.passed)[0]
+        if len(passing) > 0:
+            if not include_final:
+                opponent_moves = self.get_moves(opponent[passing], own[passing])
+                passing = passing[opponent_moves != 0]
+            parents.append(passing)
+            children.append((self.black[passing], self.white[passing], ~self.white_next[passing],
+                             np.ones(len(passing), dtype=bool)))
+            squares.append(np.zeros(len(passing), dtype=np.uint64))
+
+        if len(parents) == 0:
+            empty_batch = BoardBatch(self.size, *_get_empty_arrays())
+            return np.zeros(0, dtype=np.int64), empty_batch, np.zeros(0, dtype=np.uint64)
+        return np.concatenate(parents), BoardBatch(
+            self.size,
+            np.concatenate([child[0] for child in children]),
+            np.concatenate([child[1] for child in children]),
+            np.concatenate([child[2] for child in children]),
+            np.concatenate([child[3] for child in children])
+        ), np.concatenate(squares)
+
+
+def _get_empty_arrays():
+    return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=bool), np.zeros(0, dtype=bool)
+
+
+_shifts = {}
+
+
+def _get_shifts(geometry):
+    if geometry.size not in _shifts:
+        _shifts[geometry.size] = \
+            [(np.left_shift, np.uint64(delta), np.uint64(mask)) for delta, mask in geometry.increasing_shifts] + \
+            [(np.right_shift, np.uint64(delta), np.uint64(mask)) for delta, mask in geometry.decreasing_shifts]
+    return _shifts[geometry.size]
+
+
+def perft(batch: BoardBatch, depth: int):
+    # Число листьев на глубине depth из каждой позиции пакета вместе, как benchmark.perft
+    for i in range(depth):
+        parents, batch, squares = batch.expand(True)
+    return len(batch)
+
+
+def estimate(batch: BoardBatch, depth: int, white_perspective=None, stats: SearchStats = None):
+    # Полный минимакс без отсечений на глубину depth для каждой позиции пакета.
+    # Оценка - разность фишек со стороны, которая ходит в корне (или white_perspective для каждой позиции),
+    # и совпадает с оценкой корня AlphaBetaPlayer той же глубины
+    if white_perspective is None:
+        white_perspective = batch.white_next
+    levels = [(batch, white_perspective, None)]
+    for i in range(depth):
+        level_batch, level_perspective, level_parents = levels[-1]
+        parents, children, squares = level_batch.expand()
+        if stats is not None:
+            stats.nodes_generated += len(children)
+        if len(children) == 0:
+            break
+        levels.append((children, level_perspective[parents], parents))
+
+    values = None
+    for level_batch, level_perspective, level_parents in reversed(levels):
+        leaf_values = level_batch.get_disc_difference(level_perspective)
+        if values is not None:
+            # values и child_parents относятся к уровню ниже
+            maximum = np.full(len(level_batch), np.iinfo(np.int64).min, dtype=np.int64)
+            minimum = np.full(len(level_batch), np.iinfo(np.int64).max, dtype=np.int64)
+            np.maximum.at(maximum, child_parents, values)
+            np.minimum.at(minimum, child_parents, values)
+            has_children = np.bincount(child_parents, minlength=len(level_batch)) > 0
+            is_maximizing = level_batch.white_next == level_perspective
+            leaf_values = np.where(has_children, np.where(is_maximizing, maximum, minimum), leaf_values)
+            if stats is not None:
+                stats.leaves += int(np.count_nonzero(~has_children))
+        elif stats is not None:
+            stats.leaves += len(level_batch)
+        if stats is not None:
+            stats.nodes_visited += len(level_batch)
+        values = leaf_values
+        child_parents = level_parents
+    return values
+
+
+def choose_moves(batch: BoardBatch, depth: int, random_generator=None, stats: SearchStats = None):
+    # Лучший ход для каждой позиции пакета: (индексы позиций, у которых есть ход, позиции после хода).
+    # Равные по оценке ходы выбираются случайно, как в AlphaBetaPlayer
+    if random_generator is None:
+        random_generator = np.random.default_rng()
+    parents, children, squares = batch.expand()
+    if stats is not None:
+        stats.nodes_generated += len(children)
+    if len(children) == 0:
+        return np.zeros(0, dtype=np.int64), children
+    values = estimate(children, depth - 1, batch.white_next[parents], stats)
+    best = np.full(len(batch), np.iinfo(np.int64).min, dtype=np.int64)
+    np.maximum.at(best, parents, values)
+    priorities = np.where(values == best[parents], random_generator.random(len(values)), -1.0)
+    best_priorities = np.full(len(batch), -1.0)
+    np.maximum.at(best_priorities, parents, priorities)
+    chosen = np.nonzero(priorities == best_priorities[parents])[0]
+    # Совпадение случайных приоритетов практически невозможно, но каждой позиции нужен ровно один ход
+    chosen = chosen[np.unique(parents[chosen], return_index=True)[1]]
+    return parents[chosen], BoardBatch(
+        batch.size,
+        children.black[chosen],
+        children.white[chosen],
+        children.white_next[chosen],
+        children.passed[chosen]
+    )
@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from game_state import CellCoord, CellState, DeskState, SearchBoard, get_geometry
+from game_tree import GameTree
+from players import AlphaBetaPlayer, SearchEngine
+
+try:
+    import batch
+except ImportError:
+    # Без NumPy пакетные замеры пропускаются
+    batch = None
+
+# Позиции для perft: размер доски, ходы из начальной позиции и число листьев на глубинах 1, 2, 3...
+# Числа для 4x4 получены исходной (матричной) реализацией ходов, для 6x6 и 8x8 - независимым
+# перебором по клеткам; для начальной позиции 8x8 совпадают с общеизвестными
+PERFT_POSITIONS = {
+    'initial-4x4': (4, [], [4, 12, 44, 128, 424, 1256, 3624, 9116, 20040, 36528, 50576, 57000, 57240]),
+    'midgame-4x4': (4, [(0, 2), (2, 3), (3, 2), (0, 1)], [3, 10, 28, 67, 160, 273, 354, 402, 404, 220]),
+    'initial-6x6': (6, [], [4, 12, 56, 244, 1364, 7604]),
+    'initial-8x8': (8, [], [4, 12, 56, 244, 1396, 8200, 55092]),
+    'opening-8x8': (8, [(3, 5), (2, 3), (1, 2)], [5, 28, 166, 1044])
+}
+
+
+def get_position(size: int, moves):
+    geometry = get_geometry(size)
+    state = DeskState(True, size=size)
+    for x, y in moves:
+        square = geometry.get_square(CellCoord(x, y))
+        state = [following_state for following_state in state.get_following_states()[0]
+                 if following_state.last_move == square][0]
+    return state
+
+
+def perft(state: DeskState, depth: int):
+    if depth == 0:
+        return 1
+    following_states, passed_last_move = state.get_following_states()
+    return sum(perft(following_state, depth - 1) for following_state in following_states)
+
+
+def board_perft(board: SearchBoard, depth: int):
+    # Тот же perft ходом и его отменой на одной доске, без создания DeskState
+    if depth == 0:
+        return 1
+    moves = board.get_moves()
+    if moves == 0:
+        if board.passed_last_move:
+            return 0
+        board.make(0)
+        count = board_perft(board, depth - 1)
+        board.unmake()
+        return count
+    count = 0
+    while moves:
+        square = moves & -moves
+        moves ^= square
+        board.make(square)
+        count += board_perft(board, depth - 1)
+        board.unmake()
+    return count
+
+
+def measure(function, repeat: int):
+    # Лучшее время из нескольких повторов меньше зависит от фоновой нагрузки
+    best_time = None
+    result = None
+    for i in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        duration = time.perf_counter() - started
+        if best_time is None or duration < best_time:
+            best_time = duration
+    return result, best_time
+
+
+def run_perft_with(count_leaves, max_depth: int, repeat: int, prepare=None):
+    # Общий цикл замеров perft: count_leaves(position, depth) считает листья, prepare (вне замера)
+    # переводит DeskState в представление, с которым работает count_leaves
+    results = []
+    for name, (size, moves, counts) in PERFT_POSITIONS.items():
+        position = get_position(size, moves)
+        if prepare is not None:
+            position = prepare(position)
+        for depth in range(1, min(max_depth, len(counts)) + 1):
+            count, duration = measure(lambda: count_leaves(position, depth), repeat)
+            results.append({
+                'position': name,
+                'depth': depth,
+                'leaves': count,
+                'expected': counts[depth - 1],
+                'correct': count == counts[depth - 1],
+                'time': duration,
+                'leaves_per_second': count / duration if duration > 0 else None
+            })
+    return results
+
+
+def run_perft(max_depth: int, repeat: int):
+    return run_perft_with(perft, max_depth, repeat)
+
+
+def run_board_perft(max_depth: int, repeat: int):
+    return run_perft_with(board_perft, max_depth, repeat, SearchBoard)
+
+
+def run_batch_perft(max_depth: int, repeat: int):
+    # Тот же perft пакетным расширением уровня целиком (batch.py)
+    return run_perft_with(batch.perft, max_depth, repeat, lambda state: batch.BoardBatch.from_states([state]))
+
+
+def run_tree(size: int, max_depth: int, repeat: int):
+    # Полное (не ленивое) дерево, как для отображения в TreeFrame
+    results = []
+    state = DeskState(True, size=size)
+    for depth in range(1, max_depth + 1):
+        tree, duration = measure(lambda: GameTree(depth, state), repeat)
+        results.append({
+            'size': size,
+            'depth': depth,
+            'nodes': len(tree.nodes),
+            'graph_bytes': tree.graph.get_memory_usage(),
+            'time': duration,
+            'nodes_per_second': len(tree.nodes) / duration if duration > 0 else None
+        })
+    return results
+
+
+def run_search(size: int, max_depth: int, repeat: int):
+    # Каждый повтор - новый игрок, чтобы таблица транспозиций и история ходов не переносились
+    results = []
+    state = DeskState(True, size=size)
+    for depth in range(1, max_depth + 1):
+        def choose():
+            player = AlphaBetaPlayer(CellState.BLACK, depth)
+            player.choose_next(state)
+            return player
+        player, duration = measure(choose, repeat)
+        results.append({
+            'size': size,
+            'depth': depth,
+            'nodes': player.stats.nodes_generated,
+            'estimate': player.estimates[player.tree.root_index],
+            'time': duration,
+            'nodes_per_second': player.stats.nodes_generated / duration if duration > 0 else None,
+            'stats': player.stats.to_dict()
+        })
+    return results
+
+
+def run_engines(name: str, max_depth: int, repeat: int):
+    # Алгоритмы поиска рядом на одной позиции: оценки должны совпадать, сравнивается число узлов
+    size, moves, counts = PERFT_POSITIONS[name]
+    state = get_position(size, moves)
+    results = []
+    for depth in range(1, max_depth + 1):
+        estimates = set()
+        depth_results = []
+        for engine in SearchEngine:
+            def choose():
+                player = AlphaBetaPlayer(state.next_cell_state, depth, engine=engine)
+                player.choose_next(state)
+                return player
+            player, duration = measure(choose, repeat)
+            estimate = player.estimates[player.tree.root_index]
+            estimates.add(estimate)
+            depth_results.append({
+                'position': name,
+                'depth': depth,
+                'engine': engine.name.lower(),
+                'estimate': estimate,
+                'nodes_visited': player.stats.nodes_visited,
+                'time': duration
+            })
+        for result in depth_results:
+            result['correct'] = len(estimates) == 1
+        results.extend(depth_results)
+    return results
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for move generation, tree building and search')
+    parser.add_argument('--quick', action='store_true', help='shallower depths for a fast check')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None, help='JSON file, standard output by default')
+    args = parser.parse_args()
+
+    if args.quick:
+        perft_depth, tree_depths, search_depths = 6, {4: 6, 6: 3, 8: 3}, {4: 6, 6: 3, 8: 3}
+        engine_depths = {'midgame-4x4': 6, 'opening-8x8': 3}
+    else:
+        perft_depth, tree_depths, search_depths = 13, {4: 10, 6: 5, 8: 4}, {4: 12, 6: 8, 8: 6}
+        engine_depths = {'midgame-4x4': 10, 'opening-8x8': 6}
+
+    report = {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'repeat': args.repeat,
+        'perft': run_perft(perft_depth, args.repeat),
+        'board_perft': run_board_perft(perft_depth, args.repeat),
+        'batch_perft': run_batch_perft(perft_depth, args.repeat) if batch is not None else None,
+        'tree': [result for size, depth in tree_depths.items() for result in run_tree(size, depth, args.repeat)],
+        'search': [result for size, depth in search_depths.items() for result in run_search(size, depth, args.repeat)],
+        'engines': [result for name, depth in engine_depths.items() for result in run_engines(name, depth, args.repeat)]
+    }
+    text = json.dumps(report, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+
+    # Неверный perft - ошибка генерации ходов, а расхождение оценок алгоритмов - ошибка поиска,
+    # а не просто медленный прогон
+    checked_results = report['perft'] + report['board_perft'] + (report['batch_perft'] or []) + report['engines']
+    if not all(result['correct'] for result in checked_results):
+        sys.exit(1)
@@ -0,0 +1,166 @@
+import time
+from game_state import CellCoord, DeskState, get_geometry
+
+# Веса позиционной оценки (со стороны чёрных). Конец партии оценивается разностью фишек с весом FINAL_WEIGHT,
+# чтобы любая выигранная партия была лучше любой позиционной оценки
+CORNER_WEIGHT = 25
+STABLE_WEIGHT = 6
+EDGE_WEIGHT = 1
+C_SQUARE_WEIGHT = 8
+X_SQUARE_WEIGHT = 15
+MOBILITY_WEIGHT = 3
+FINAL_WEIGHT = 1000
+
+EMPTY = 0
+BLACK = 1
+WHITE = 2
+
+
+def _get_edge_value(cells):
+    # Край: углы, устойчивые фишки (сплошной ряд своего цвета от своего угла или весь заполненный край)
+    # и C-клетки рядом с пустым углом, которые отдают угол противнику
+    value = 0
+    last = len(cells) - 1
+    stable = set()
+    if EMPTY not in cells:
+        stable = set(range(1, last))
+    for corner, step in ((0, 1), (last, -1)):
+        if cells[corner] == EMPTY:
+            if cells[corner + step] == BLACK:
+                value -= C_SQUARE_WEIGHT
+            elif cells[corner + step] == WHITE:
+                value += C_SQUARE_WEIGHT
+            continue
+        value += CORNER_WEIGHT if cells[corner] == BLACK else -CORNER_WEIGHT
+        index = corner + step
+        while 0 < index < last and cells[index] == cells[corner]:
+            stable.add(index)
+            index += step
+    for index in range(1, last):
+        if cells[index] == EMPTY:
+            continue
+        weight = STABLE_WEIGHT if index in stable else EDGE_WEIGHT
+        value += weight if cells[index] == BLACK else -weight
+    return value
+
+
+def _get_diagonal_value(cells):
+    # Главная диагональ: X-клетки рядом с пустым углом (сами углы оцениваются краями)
+    value = 0
+    last = len(cells) - 1
+    for corner, step in ((0, 1), (last, -1)):
+        if cells[corner] == EMPTY:
+            if cells[corner + step] == BLACK:
+                value -= X_SQUARE_WEIGHT
+            elif cells[corner + step] == WHITE:
+                value += X_SQUARE_WEIGHT
+    return value
+
+
+class PatternEvaluator:
+    # Оценка по образцам линий: клетки линии (пусто, чёрная, белая) - число в троичной записи,
+    # оценка линии берётся из таблицы по этому числу. Линия собирается из масок доски одним умножением:
+    # биты линии, сдвинутые к началу доски, множитель переносит подряд начиная с бита position
+    def __init__(self, size: int):
+        self.geometry = get_geometry(size)
+        self.size = size
+        self.line_mask = (1 << size) - 1
+        # Троичное число из двоичного: каждый бит становится троичной цифрой 0 или 1
+        self.base3 = [sum(3 ** i for i in range(size) if bits & (1 << i)) for bits in range(1 << size)]
+        edge_table = self.__get_table(_get_edge_value)
+        diagonal_table = self.__get_table(_get_diagonal_value)
+
+        geometry = self.geometry
+        column = sum(geometry.get_square(CellCoord(0, y)) for y in range(size))
+        diagonal = sum(geometry.get_square(CellCoord(y, y)) for y in range(size))
+        anti_diagonal = sum(geometry.get_square(CellCoord(size - 1 - y, y)) for y in range(size)) >> (size - 1)
+        column_position = (size - 1) * (size - 1)
+        diagonal_position = size * (size - 1)
+        # (сдвиг к началу доски, маска линии после сдвига, множитель, начало собранной линии, таблица)
+        self.lines = [
+            (0, self.line_mask, 1, 0, edge_table),
+            (geometry.cell_count - size, self.line_mask, 1, 0, edge_table),
+            (0, column, sum(1 << (column_position + y - y * size) for y in range(size)), column_position, edge_table),
+            (size - 1, column, sum(1 << (column_position + y - y * size) for y in range(size)), column_position,
+             edge_table),
+            (0, diagonal, sum(1 << (diagonal_position - y * size) for y in range(size)), diagonal_position,
+             diagonal_table),
+            # Побочная диагональ собирается в обратном порядке, таблица симметрична
+            (size - 1, anti_diagonal, sum(1 << (column_position + size - 1 - y * size) for y in range(size)),
+             column_position, diagonal_table)
+        ]
+        for shift, mask, magic, position, table in self.lines:
+            self.__check_line(shift, mask, magic, position)
+
+    def __get_table(self, get_value):
+        table = []
+        for index in range(3 ** self.size):
+            cells = []
+            for i in range(self.size):
+                cells.append(index % 3)
+                index //= 3
+            table.append(get_value(cells))
+        return table
+
+    def __check_line(self, shift: int, mask: int, magic: int, position: int):
+        # Множитель не должен давать переносов: каждая клетка линии попадает в свой бит
+        cells = []
+        remaining = mask
+        while remaining:
+            square = remaining & -remaining
+            remaining ^= square
+            cells.append(square)
+        for square in cells:
+            line = ((square * magic) >> position) & self.line_mask
+            if line.bit_count() != 1 or (mask * magic >> position) & self.line_mask != self.line_mask:
+                raise ValueError('Line gather does not fit the board size %d' % self.size)
+
+    def evaluate(self, black: int, white: int):
+        # Оценка позиции со стороны чёрных: образцы линий и разность числа ходов.
+        # Если ходов нет ни у кого, партия окончена и оценка точная
+        black_moves = self.geometry.get_moves(black, white).bit_count()
+        white_moves = self.geometry.get_moves(white, black).bit_count()
+        if black_moves == 0 and white_moves == 0:
+            return FINAL_WEIGHT * (black.bit_count() - white.bit_count())
+        value = MOBILITY_WEIGHT * (black_moves - white_moves)
+        base3 = self.base3
+        line_mask = self.line_mask
+        for shift, mask, magic, position, table in self.lines:
+            black_line = (((black >> shift) & mask) * magic >> position) & line_mask
+            white_line = (((white >> shift) & mask) * magic >> position) & line_mask
+            value += table[base3[black_line] + 2 * base3[white_line]]
+        return value
+
+
+_evaluators = {}
+
+
+def get_evaluator(size: int):
+    # Таблицы строятся один раз на размер доски
+    if size not in _evaluators:
+        _evaluators[size] = PatternEvaluator(size)
+    return _evaluators[size]
+
+
+def measure_leaf_cost(sizes, repeat: int = 20000):
+    # Время оценки одного листа (мкс): разность фишек и таблицы образцов на начальной позиции
+    results = []
+    for size in sizes:
+        state = DeskState(True, size=size)
+        evaluator = get_evaluator(size)
+        started = time.perf_counter()
+        for i in range(repeat):
+            state.get_cell_state_distribution()
+        disc_time = (time.perf_counter() - started) / repeat
+        started = time.perf_counter()
+        for i in range(repeat):
+            evaluator.evaluate(state.black, state.white)
+        pattern_time = (time.perf_counter() - started) / repeat
+        results.append((size, disc_time * 1e6, pattern_time * 1e6))
+    return results
+
+
+if __name__ == "__main__":
+    print('size discs_us patterns_us')
+    for result in measure_leaf_cost((4, 6, 8)):
+        print('%4d %8.2f %11.2f' % result)
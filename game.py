@@ -5,15 +5,17 @@ from game_state import DeskState, CellState
 class Game:
     def __init__(self,
                  first_player: Player,
-                 second_player: Player
+                 second_player: Player,
+                 size: int = 4
                  ):
+        self.size = size
         self.new_game(first_player, second_player)
 
     def new_game(self, first_player: Player, second_player: Player):
         self.first_player = first_player
         self.second_player = second_player
         self.prev_state = None
-        self.current_state = DeskState(True)
+        self.current_state = DeskState(True, size=self.size)
         self.next_cell_state_to_apply = CellState.BLACK
         self.is_finished = False
         if self.is_person_next():
@@ -27,14 +29,26 @@ class Game:
                self.next_cell_state_to_apply == CellState.WHITE and \
                self.second_player.player_type == PlayerType.PERSON
 
-    def next(self):
-        self.prev_state = self.current_state
+    def get_next_player(self):
+        if self.next_cell_state_to_apply == CellState.BLACK:
+            return self.first_player
+        else:
+            return self.second_player
+
+    def get_waiting_player(self):
         if self.next_cell_state_to_apply == CellState.BLACK:
-            self.current_state = self.first_player.choose_next(self.current_state)
-            self.next_cell_state_to_apply = CellState.WHITE
+            return self.second_player
         else:
-            self.current_state = self.second_player.choose_next(self.current_state)
-            self.next_cell_state_to_apply = CellState.BLACK
+            return self.first_player
+
+    def next(self):
+        self.apply(self.get_next_player().choose_next(self.current_state))
+
+    # Ход выбирается отдельно от применения: бот может искать его в другом потоке
+    def apply(self, next_state: DeskState):
+        self.prev_state = self.current_state
+        self.current_state = next_state
+        self.next_cell_state_to_apply = self.next_cell_state_to_apply.get_opposite()
 
         if self.current_state is None:
             self.is_finished = True
@@ -44,7 +58,9 @@ class Game:
             self.allowed_steps_for_person = self.current_state.get_allowed_cells()
             if self.allowed_steps_for_person is None or len(self.allowed_steps_for_person) == 0:
                 black_count, white_count, empty_count = self.current_state.get_cell_state_distribution()
-                if empty_count == 1 or self.prev_state.matrix == self.current_state.matrix:
+                # Позиция не изменилась - предыдущий ход был пропуском, ходить некому
+                if empty_count == 1 or (self.prev_state.black == self.current_state.black and
+                                        self.prev_state.white == self.current_state.white):
                     self.is_finished = True
                     return
 
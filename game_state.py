@@ -1,3 +1,4 @@
+import random
 from enum import Enum
 
 
@@ -23,8 +24,8 @@ class CellCoord:
         self.x = x
         self.y = y
 
-    def is_valid(self):
-        return 0 <= self.x < 4 and 0 <= self.y < 4
+    def is_valid(self, size: int = 4):
+        return 0 <= self.x < size and 0 <= self.y < size
 
     def __eq__(self, other):
         if isinstance(other, CellCoord):
@@ -52,6 +53,142 @@ class CellState(Enum):
             return CellState.BLACK
 
 
+class BoardGeometry:
+    # Всё, что зависит только от размера доски, считается один раз на размер (см. get_geometry).
+    # Доска хранится двумя битовыми масками (по одной на цвет), клетка (x, y) - бит y * size + x
+    def __init__(self, size: int):
+        self.size = size
+        self.cell_count = size * size
+        self.full_mask = (1 << self.cell_count) - 1
+        # Самая длинная линия фишек противника, которую можно замкнуть
+        self.max_line_length = size - 2
+
+        left_column = 0
+        for y in range(size):
+            left_column |= self.get_square(CellCoord(0, y))
+        right_column = left_column << (size - 1)
+        top_row = (1 << size) - 1
+        bottom_row = top_row << (self.cell_count - size)
+        self.corners = self.get_square(CellCoord(0, 0)) | self.get_square(CellCoord(size - 1, 0)) | \
+            self.get_square(CellCoord(0, size - 1)) | self.get_square(CellCoord(size - 1, size - 1))
+        self.edges = (left_column | right_column | top_row | bottom_row) & ~self.corners
+
+        # Сдвиг маски на один шаг в направлении и маска, отсекающая перенос через край доски.
+        # Сдвиги разделены по знаку (к старшим и к младшим битам), чтобы в цикле не было ветвлений
+        self.increasing_shifts = []
+        self.decreasing_shifts = []
+        for direction in Direction:
+            step = direction.value
+            delta = step.y * size + step.x
+            mask = self.full_mask
+            if step.x > 0:
+                mask &= ~left_column
+            elif step.x < 0:
+                mask &= ~right_column
+            if delta > 0:
+                self.increasing_shifts.append((delta, mask))
+            else:
+                self.decreasing_shifts.append((-delta, mask))
+
+        # Лучи: клетки, которые проходит линия из каждой клетки в каждом направлении.
+        # Лучи короче двух клеток ничего замкнуть не могут и не хранятся
+        self.rays = {}
+        self.direction_rays = {}
+        for index in range(self.cell_count):
+            square = 1 << index
+            self.rays[square] = []
+            self.direction_rays[square] = []
+            for direction in Direction:
+                step = direction.value
+                cell_coord = CellCoord(index % size + step.x, index // size + step.y)
+                ray = []
+                while cell_coord.is_valid(size):
+                    ray.append(self.get_square(cell_coord))
+                    cell_coord = CellCoord(cell_coord.x + step.x, cell_coord.y + step.y)
+                if len(ray) >= 2:
+                    self.rays[square].append(tuple(ray))
+                    self.direction_rays[square].append((direction, tuple(ray)))
+
+        # Ключи Зобриста: хеш позиции - XOR ключей занятых клеток и ключа очереди хода белых
+        zobrist_random = random.Random(177 + size)
+        self.zobrist_black = {1 << index: zobrist_random.getrandbits(64) for index in range(self.cell_count)}
+        self.zobrist_white = {1 << index: zobrist_random.getrandbits(64) for index in range(self.cell_count)}
+        self.zobrist_flip = {square: self.zobrist_black[square] ^ self.zobrist_white[square] for square in self.zobrist_black}
+        self.zobrist_white_next = zobrist_random.getrandbits(64)
+
+    def get_square(self, cell_coord: CellCoord):
+        return 1 << (cell_coord.y * self.size + cell_coord.x)
+
+    def get_cell_coord(self, square: int):
+        index = square.bit_length() - 1
+        return CellCoord(index % self.size, index // self.size)
+
+    def get_zobrist_hash(self, black: int, white: int, next_cell_state: CellState):
+        position_hash = 0
+        for square in self.zobrist_black:
+            if black & square:
+                position_hash ^= self.zobrist_black[square]
+            elif white & square:
+                position_hash ^= self.zobrist_white[square]
+        if next_cell_state == CellState.WHITE:
+            position_hash ^= self.zobrist_white_next
+        return position_hash
+
+    def get_moves(self, own: int, opponent: int):
+        # Все клетки, замыкающие хотя бы одну линию фишек противника, считаются за раз сдвигами масок
+        empty = ~(own | opponent) & self.full_mask
+        extensions = range(self.max_line_length - 1)
+        moves = 0
+        for delta, mask in self.increasing_shifts:
+            closable = mask & opponent
+            line = (own << delta) & closable
+            for i in extensions:
+                line |= (line << delta) & closable
+            moves |= (line << delta) & mask & empty
+        for delta, mask in self.decreasing_shifts:
+            closable = mask & opponent
+            line = (own >> delta) & closable
+            for i in extensions:
+                line |= (line >> delta) & closable
+            moves |= (line >> delta) & mask & empty
+        return moves
+
+    def get_flips(self, square: int, own: int, opponent: int):
+        # Фишки противника, переворачиваемые ходом в square: по лучам из клетки хода, без проверок выхода за край
+        flipped = 0
+        for ray in self.rays[square]:
+            line = 0
+            for cell in ray:
+                if cell & opponent:
+                    line |= cell
+                else:
+                    if cell & own:
+                        flipped |= line
+                    break
+        return flipped
+
+    def get_zobrist_change(self, square: int, flipped: int, new_cell_state: CellState):
+        # Изменение хеша при постановке фишки в square и перевороте фишек flipped
+        if new_cell_state == CellState.BLACK:
+            change = self.zobrist_black[square]
+        else:
+            change = self.zobrist_white[square]
+        while flipped:
+            flipped_square = flipped & -flipped
+            flipped ^= flipped_square
+            change ^= self.zobrist_flip[flipped_square]
+        return change
+
+
+_geometries = {}
+
+
+def get_geometry(size: int):
+    if size not in _geometries:
+        _geometries[size] = BoardGeometry(size)
+    return _geometries[size]
+
+
 class DeskState:
     def __init__(
             self,
@@ -59,33 +196,45 @@ class DeskState:
             is_root: bool = None,
             parent_depth: int = None,
             new_cell_state: CellState = None,
-            prev_state_matrix: list[list[CellState]] = None,
+            prev_state: 'DeskState' = None,
             cell_coord: CellCoord = None,
             directions: list[Direction] = None,
-            passed_last_move: bool = None
+            passed_last_move: bool = None,
+            size: int = 4
     ):
-        self.matrix = [[CellState.EMPTY] * 4 for i in range(4)]
-
         self.passed_last_move = False
+        # Клетка (бит маски), на которую поставлена последняя фишка, 0 - хода не было
+        self.last_move = 0
+        # Каноническая форма позиции и симметрия, переводящая в неё (см. symmetry.py), считается по требованию
+        self.canonical = None
 
         if is_initial_state:
+            self.size = size
+            geometry = get_geometry(size)
             self.depth = 0
-            self.matrix[1][1] = CellState.BLACK
-            self.matrix[2][2] = CellState.BLACK
-            self.matrix[1][2] = CellState.WHITE
-            self.matrix[2][1] = CellState.WHITE
+            center = size // 2
+            self.black = geometry.get_square(CellCoord(center - 1, center - 1)) | geometry.get_square(CellCoord(center, center))
+            self.white = geometry.get_square(CellCoord(center, center - 1)) | geometry.get_square(CellCoord(center - 1, center))
+
+            # Число фишек каждого цвета и хеш позиции обновляются при каждом ходе, а не пересчитываются
+            self.black_count = 2
+            self.white_count = 2
 
             self.next_cell_state = CellState.BLACK
             self.last_cell_state = CellState.WHITE
+            self.hash = geometry.get_zobrist_hash(self.black, self.white, self.next_cell_state)
         else:
             if is_root:
                 self.depth = 0
             else:
                 self.depth = parent_depth + 1
 
-            for i in range(4):
-                for j in range(4):
-                    self.matrix[i][j] = prev_state_matrix[i][j]
+            self.size = prev_state.size
+            self.black = prev_state.black
+            self.white = prev_state.white
+            self.black_count = prev_state.black_count
+            self.white_count = prev_state.white_count
+            self.hash = prev_state.hash
 
             if new_cell_state is not None and cell_coord is not None and directions is not None:
                 self.seize_lines(cell_coord, new_cell_state, directions)
@@ -96,108 +245,131 @@ class DeskState:
 
             self.last_cell_state = new_cell_state
             self.next_cell_state = new_cell_state.get_opposite()
+            if self.next_cell_state != prev_state.next_cell_state:
+                self.hash ^= get_geometry(self.size).zobrist_white_next
+
+    @property
+    def matrix(self):
+        return [[self.get_cell_state(CellCoord(j, i)) for j in range(self.size)] for i in range(self.size)]
+
+    def get_cell_state(self, cell_coord: CellCoord):
+        square = get_geometry(self.size).get_square(cell_coord)
+        if self.black & square:
+            return CellState.BLACK
+        elif self.white & square:
+            return CellState.WHITE
+        else:
+            return CellState.EMPTY
 
     def seize_lines(self, cell_coord: CellCoord, new_cell_state: CellState, directions: list[Direction]):
-        self.matrix[cell_coord.y][cell_coord.x] = new_cell_state
-        for direction in directions:
-            step = direction.value
-            current_cell_coord = CellCoord(cell_coord.x + step.x, cell_coord.y + step.y)
-            while self.matrix[current_cell_coord.y][current_cell_coord.x] != new_cell_state:
-                self.matrix[current_cell_coord.y][current_cell_coord.x] = new_cell_state
-                current_cell_coord.x += step.x
-                current_cell_coord.y += step.y
+        geometry = get_geometry(self.size)
+        own, opponent = self.__get_sides(new_cell_state)
+        square = geometry.get_square(cell_coord)
+        flipped = 0
+        for direction, ray in geometry.direction_rays[square]:
+            if direction in directions:
+                flipped |= self.__get_line(ray, own, opponent)
+        own |= square | flipped
+        opponent &= ~flipped
+        self.last_move = square
+        self.canonical = None
+        self.hash ^= geometry.get_zobrist_change(square, flipped, new_cell_state)
+        flipped_count = flipped.bit_count()
+        if new_cell_state == CellState.BLACK:
+            self.black, self.white = own, opponent
+            self.black_count += flipped_count + 1
+            self.white_count -= flipped_count
+        else:
+            self.black, self.white = opponent, own
+            self.white_count += flipped_count + 1
+            self.black_count -= flipped_count
 
     def get_following_states(self):
+        geometry = get_geometry(self.size)
+        rays = geometry.rays
         following_states = []
-        for i in range(4):
-            for j in range(4):
-                cell_coord = CellCoord(j, i)
-                directions = self.__get_directions(cell_coord)
-                if len(directions) > 0:
-                    following_state = DeskState(False, False, self.depth, self.next_cell_state, self.matrix, cell_coord, directions)
-                    following_states.append(following_state)
+        own, opponent = self.__get_sides(self.next_cell_state)
+        moves = geometry.get_moves(own, opponent)
+        while moves:
+            square = moves & -moves
+            moves ^= square
+            # То же, что geometry.get_flips, но без вызова: это самый частый цикл генерации ходов
+            flipped = 0
+            for ray in rays[square]:
+                line = 0
+                for cell in ray:
+                    if cell & opponent:
+                        line |= cell
+                    else:
+                        if cell & own:
+                            flipped |= line
+                        break
+            following_state = self.__derive(own | square | flipped, opponent & ~flipped, flipped.bit_count())
+            following_state.last_move = square
+            following_state.hash = self.hash ^ geometry.zobrist_white_next ^ \
+                geometry.get_zobrist_change(square, flipped, self.next_cell_state)
+            following_states.append(following_state)
 
         # Пропуск хода
         if len(following_states) == 0 and not self.passed_last_move:
-            following_states = [DeskState(False, False, self.depth, self.next_cell_state, self.matrix)]
+            following_states = [DeskState(False, False, self.depth, self.next_cell_state, self)]
 
         return following_states, self.passed_last_move
 
     def get_allowed_cells(self):
+        geometry = get_geometry(self.size)
         allowed_cells_and_directories = []
-        for i in range(4):
-            for j in range(4):
-                cell_coord = CellCoord(j, i)
-                directions = self.__get_directions(cell_coord)
-                if len(directions) > 0:
-                    allowed = (cell_coord, directions)
-                    allowed_cells_and_directories.append(allowed)
+        own, opponent = self.__get_sides(self.next_cell_state)
+        moves = geometry.get_moves(own, opponent)
+        while moves:
+            square = moves & -moves
+            moves ^= square
+            directions = []
+            for direction, ray in geometry.direction_rays[square]:
+                if self.__get_line(ray, own, opponent):
+                    directions.append(direction)
+            allowed_cells_and_directories.append((geometry.get_cell_coord(square), directions))
         return allowed_cells_and_directories
 
     def get_cell_state_distribution(self):
-        black_count = 0
-        white_count = 0
-        for row in self.matrix:
-            for el in row:
-                if el == CellState.BLACK:
-                    black_count += 1
-                elif el == CellState.WHITE:
-                    white_count += 1
-        empty_count = 16 - black_count - white_count
-        return black_count, white_count, empty_count
-
-    def __get_directions(self, cell_coord: CellCoord):
-        if self.matrix[cell_coord.y][cell_coord.x] == CellState.EMPTY:
-            directions = []
-
-            left = self.__has_closing(cell_coord, Direction.LEFT.value)
-            if left:
-                directions.append(Direction.LEFT)
-
-            right = self.__has_closing(cell_coord, Direction.RIGHT.value)
-            if right:
-                directions.append(Direction.RIGHT)
-
-            up = self.__has_closing(cell_coord, Direction.UP.value)
-            if up:
-                directions.append(Direction.UP)
-
-            down = self.__has_closing(cell_coord, Direction.DOWN.value)
-            if down:
-                directions.append(Direction.DOWN)
+        return self.black_count, self.white_count, self.size * self.size - self.black_count - self.white_count
 
-            left_up = self.__has_closing(cell_coord, Direction.LEFT_UP.value)
-            if left_up:
-                directions.append(Direction.LEFT_UP)
-
-            right_up = self.__has_closing(cell_coord, Direction.RIGHT_UP.value)
-            if right_up:
-                directions.append(Direction.RIGHT_UP)
-
-            left_down = self.__has_closing(cell_coord, Direction.LEFT_DOWN.value)
-            if left_down:
-                directions.append(Direction.LEFT_DOWN)
-
-            right_down = self.__has_closing(cell_coord, Direction.RIGHT_DOWN.value)
-            if right_down:
-                directions.append(Direction.RIGHT_DOWN)
-
-            return directions
+    def __get_sides(self, cell_state: CellState):
+        if cell_state == CellState.BLACK:
+            return self.black, self.white
         else:
-            return []
-
-    def __has_closing(self, cell_coord: CellCoord, step: Step):
-        current_cell_coord = CellCoord(cell_coord.x + step.x, cell_coord.y + step.y)
-        if current_cell_coord.is_valid() and self.matrix[current_cell_coord.y][current_cell_coord.x] == self.last_cell_state:
-            current_cell_coord.x += step.x
-            current_cell_coord.y += step.y
-            while current_cell_coord.is_valid() and self.matrix[current_cell_coord.y][current_cell_coord.x] == self.last_cell_state:
-                current_cell_coord.x += step.x
-                current_cell_coord.y += step.y
-            if current_cell_coord.is_valid() and self.matrix[current_cell_coord.y][current_cell_coord.x] == self.next_cell_state:
-                return True
+            return self.white, self.black
+
+    @staticmethod
+    def __get_line(ray: tuple, own: int, opponent: int):
+        # Фишки противника на луче, которые замыкает ход из начала луча
+        line = 0
+        for cell in ray:
+            if cell & opponent:
+                line |= cell
+            elif cell & own:
+                return line
             else:
-                return False
+                return 0
+        return 0
+
+    def __derive(self, own: int, opponent: int, flipped_count: int):
+        following_state = DeskState.__new__(DeskState)
+        following_state.size = self.size
+        following_state.depth = self.depth + 1
+        following_state.passed_last_move = False
+        following_state.canonical = None
+        following_state.last_cell_state = self.next_cell_state
+        following_state.next_cell_state = self.last_cell_state
+        if self.next_cell_state == CellState.BLACK:
+            following_state.black, following_state.white = own, opponent
+            following_state.black_count = self.black_count + flipped_count + 1
+            following_state.white_count = self.white_count - flipped_count
+        else:
+            following_state.black, following_state.white = opponent, own
+            following_state.white_count = self.white_count + flipped_count + 1
+            following_state.black_count = self.black_count - flipped_count
+        return following_state
 
     def print(self):
         for row in self.matrix:
@@ -205,5 +377,85 @@ class DeskState:
 
     def __eq__(self, other):
         if isinstance(other, DeskState):
-            return self.matrix == other.matrix and self.next_cell_state == other.next_cell_state
+            return self.black == other.black and self.white == other.white and \
+                   self.next_cell_state == other.next_cell_state
         return False
+
+    def __hash__(self):
+        return self.hash
+
+
+class SearchBoard:
+    # Доска для перебора без сохранения узлов: ход делается на месте, а отменяется по стеку
+    # (клетка, перевёрнутые фишки, прежние флаг пропуска и хеш). DeskState создаётся только для позиции,
+    # которую нужно сохранить (get_state)
+    def __init__(self, state: DeskState):
+        self.geometry = get_geometry(state.size)
+        self.size = state.size
+        self.depth = state.depth
+        # Ходят белые; флаг вместо CellState, чтобы не вызывать get_opposite на каждом ходе
+        self.white_next = state.next_cell_state == CellState.WHITE
+        if self.white_next:
+            self.own, self.opponent = state.white, state.black
+        else:
+            self.own, self.opponent = state.black, state.white
+        self.passed_last_move = state.passed_last_move
+        self.hash = state.hash
+        self.undo_stack = []
+
+    def get_moves(self):
+        return self.geometry.get_moves(self.own, self.opponent)
+
+    def make(self, square: int):
+        # square - клетка хода, 0 - пропуск хода
+        geometry = self.geometry
+        own, opponent = self.own, self.opponent
+        flipped = 0
+        position_hash = self.hash ^ geometry.zobrist_white_next
+        if square:
+            # То же, что geometry.get_flips, но без вызова, как в DeskState.get_following_states
+            for ray in geometry.rays[square]:
+                line = 0
+                for cell in ray:
+                    if cell & opponent:
+                        line |= cell
+                    else:
+                        if cell & own:
+                            flipped |= line
+                        break
+            position_hash ^= geometry.get_zobrist_change(
+                square, flipped, CellState.WHITE if self.white_next else CellState.BLACK)
+        self.undo_stack.append((square, flipped, self.passed_last_move, self.hash))
+        self.hash = position_hash
+        self.own, self.opponent = opponent & ~flipped, own | square | flipped
+        self.passed_last_move = square == 0
+        self.white_next = not self.white_next
+        self.depth += 1
+
+    def unmake(self):
+        square, flipped, self.passed_last_move, self.hash = self.undo_stack.pop()
+        self.own, self.opponent = self.opponent & ~(square | flipped), self.own | flipped
+        self.white_next = not self.white_next
+        self.depth -= 1
+
+    def get_disc_difference(self):
+        # Разность фишек со стороны того, кто ходит
+        return self.own.bit_count() - self.opponent.bit_count()
+
+    def get_state(self):
+        state = DeskState.__new__(DeskState)
+        state.size = self.size
+        state.depth = self.depth
+        state.passed_last_move = self.passed_last_move
+        state.last_move = self.undo_stack[-1][0] if self.undo_stack else 0
+        state.canonical = None
+        if self.white_next:
+            state.next_cell_state, state.last_cell_state = CellState.WHITE, CellState.BLACK
+            state.black, state.white = self.opponent, self.own
+        else:
+            state.next_cell_state, state.last_cell_state = CellState.BLACK, CellState.WHITE
+            state.black, state.white = self.own, self.opponent
+        state.black_count = state.black.bit_count()
+        state.white_count = state.white.bit_count()
+        state.hash = self.hash
+        return state
@@ -1,19 +1,35 @@
 from game_state import DeskState
 from graph import Graph
+from symmetry import get_canonical_key
 
 
 class GameTree:
-    def __init__(self, move_number: int, state: DeskState = None):
+    def __init__(self, move_number: int, state: DeskState = None, is_lazy: bool = False, use_symmetry: bool = False):
         if state is None:
             initial_state = DeskState(True)
         else:
-            initial_state = DeskState(False, True, state.depth, state.next_cell_state.get_opposite(), state.matrix, passed_last_move=state.passed_last_move)
+            initial_state = DeskState(False, True, state.depth, state.next_cell_state.get_opposite(), state, passed_last_move=state.passed_last_move)
 
         self.move_number = move_number
+        self.is_lazy = is_lazy
+        # С симметриями повороты и отражения позиции считаются одним узлом: узел дерева может
+        # быть образом настоящей позиции, а не ею самой
+        self.use_symmetry = use_symmetry
         self.nodes = []
+        # Индекс узлов по позиции (хеш Зобриста), чтобы не искать повторы линейно по self.nodes
+        self.node_indexes = {}
         self.graph = Graph()
         self.count_on_level = [0] * (move_number + 1)
-        self.root_index = self.__build(initial_state)
+        # Раскрыт ли узел, то есть построены ли все его потомки
+        self.is_expanded = []
+        if is_lazy:
+            # Ленивое дерево: потомки узла строятся только при первом обращении к get_children
+            if self.__is_final(initial_state):
+                self.root_index = -1
+            else:
+                self.root_index = self.__add_node(initial_state)
+        else:
+            self.root_index = self.__build(initial_state)
 
     def __build(self, state: DeskState):
         children_indexes = []
@@ -23,8 +39,9 @@ class GameTree:
             return -1
         elif state.depth < self.move_number:
             for following_state in following_states:
-                if following_state in self.nodes:
-                    children_indexes.append(self.nodes.index(following_state))
+                key = self.get_key(following_state)
+                if key in self.node_indexes:
+                    children_indexes.append(self.node_indexes[key])
                 else:
                     child_index = self.__build(following_state)
                     children_indexes.append(child_index)
@@ -33,6 +50,8 @@ class GameTree:
 
         state_index = len(self.nodes)
         self.nodes.append(state)
+        self.node_indexes[self.get_key(state)] = state_index
+        self.is_expanded.append(state.depth < self.move_number)
 
         for child_node_index in children_indexes:
             if child_node_index >= 0:
@@ -40,6 +59,98 @@ class GameTree:
 
         return state_index
 
+    def get_children(self, state_index):
+        # Узлы глубже границы (остались от прошлого хода или итерации) считаются листьями
+        if self.nodes[state_index].depth >= self.move_number:
+            return ()
+        if not self.is_expanded[state_index]:
+            self.__expand(state_index)
+        return self.graph.get_related_nodes(state_index)
+
+    def expand_all(self):
+        visited = {self.root_index}
+        states_to_expand = [self.root_index]
+        while len(states_to_expand) > 0:
+            for child_index in self.get_children(states_to_expand.pop()):
+                if child_index not in visited:
+                    visited.add(child_index)
+                    states_to_expand.append(child_index)
+
+    def __expand(self, state_index):
+        self.is_expanded[state_index] = True
+        following_states, passed_last_move = self.nodes[state_index].get_following_states()
+        for following_state in following_states:
+            # Проверка конца игры идёт до поиска повтора: иначе пропуск хода мог бы совпасть
+            # с уже созданным предком (равенство не учитывает passed_last_move) и замкнуть цикл
+            if self.__is_final(following_state):
+                continue
+            key = self.get_key(following_state)
+            if key in self.node_indexes:
+                child_index = self.node_indexes[key]
+            else:
+                child_index = self.__add_node(following_state)
+            self.graph.insert_node(state_index, child_index)
+
+    def deepen(self, move_number: int):
+        self.count_on_level.extend([0] * (move_number + 1 - len(self.count_on_level)))
+        self.move_number = move_number
+
+    def reroot(self, state: DeskState, move_number: int):
+        # Корнем становится уже построенный узел state (например, после хода соперника),
+        # его поддерево сохраняется, остальные узлы отбрасываются.
+        # Возвращает старые индексы узлов в новом порядке или None, если state в дереве нет
+        key = self.get_key(state)
+        if key not in self.node_indexes:
+            return None
+
+        old_indexes = [self.node_indexes[key]]
+        new_indexes = {old_indexes[0]: 0}
+        levels = [0]
+        for old_index in old_indexes:
+            level = levels[new_indexes[old_index]]
+            for child_index in self.graph.get_related_nodes(old_index):
+                if child_index not in new_indexes:
+                    new_indexes[child_index] = len(old_indexes)
+                    old_indexes.append(child_index)
+                    levels.append(level + 1)
+
+        graph = Graph()
+        for old_index in old_indexes:
+            for child_index in self.graph.get_related_nodes(old_index):
+                graph.insert_node(new_indexes[old_index], new_indexes[child_index])
+
+        self.nodes = [self.nodes[old_index] for old_index in old_indexes]
+        self.is_expanded = [self.is_expanded[old_index] for old_index in old_indexes]
+        self.graph = graph
+        self.move_number = move_number
+        self.count_on_level = [0] * (max(move_number, levels[-1]) + 1)
+        self.node_indexes = {}
+        for state_index, node in enumerate(self.nodes):
+            node.depth = levels[state_index]
+            self.count_on_level[node.depth] += 1
+            self.node_indexes[self.get_key(node)] = state_index
+        self.root_index = 0
+        return old_indexes
+
+    def __add_node(self, state: DeskState):
+        self.count_on_level[state.depth] += 1
+
+        state_index = len(self.nodes)
+        self.nodes.append(state)
+        self.node_indexes[self.get_key(state)] = state_index
+        self.is_expanded.append(False)
+        return state_index
+
+    def get_key(self, state: DeskState):
+        if self.use_symmetry:
+            return get_canonical_key(state)[0]
+        return state
+
+    @staticmethod
+    def __is_final(state: DeskState):
+        # Оба игрока пропустили ход - такие позиции в дерево не попадают, как и в __build
+        return state.passed_last_move and len(state.get_following_states()[0]) == 0
+
     def get_max_count_on_level(self):
         max_count = 0
         for count in self.count_on_level:
@@ -1,24 +1,87 @@
+import sys
+from array import array
+
+
 class Graph:
+    # Списки смежности в виде CSR: потомки узла лежат подряд в self.children с позиции
+    # self.offsets[узел], их число - self.degrees[узел]. Родители узлов хранятся так же (обратный индекс),
+    # поэтому удаление узла стоит O(числа его связей), а не O(числа узлов)
     def __init__(self):
-        self.graph = list()
+        self.offsets = array('i')
+        self.degrees = array('i')
+        self.children = array('i')
+        self.parent_offsets = array('i')
+        self.parent_degrees = array('i')
+        self.parents = array('i')
 
     def insert_node(self, parent_node_index, new_node_index):
-        while len(self.graph) <= parent_node_index:
-            self.graph.append(set())
-        self.graph[parent_node_index].add(new_node_index)
+        self.__reserve(max(parent_node_index, new_node_index))
+        if self.__append(self.offsets, self.degrees, self.children, parent_node_index, new_node_index):
+            self.__append(self.parent_offsets, self.parent_degrees, self.parents, new_node_index, parent_node_index)
 
     def remove_node(self, node_index):
-        for refs in self.graph:
-            if node_index in refs:
-                refs.remove(node_index)
-        if node_index < len(self.graph):
-            self.graph[node_index].clear()
+        if node_index >= len(self.offsets):
+            return
+        for parent_node_index in self.get_parent_nodes(node_index):
+            self.__discard(self.offsets, self.degrees, self.children, parent_node_index, node_index)
+        for child_node_index in self.get_related_nodes(node_index):
+            self.__discard(self.parent_offsets, self.parent_degrees, self.parents, child_node_index, node_index)
+        self.degrees[node_index] = 0
+        self.parent_degrees[node_index] = 0
 
     def get_related_nodes(self, node_index):
-        if node_index < len(self.graph):
-            return self.graph[node_index]
+        if node_index < len(self.offsets):
+            offset = self.offsets[node_index]
+            return self.children[offset:offset + self.degrees[node_index]]
+        else:
+            return array('i')
+
+    def get_parent_nodes(self, node_index):
+        if node_index < len(self.parent_offsets):
+            offset = self.parent_offsets[node_index]
+            return self.parents[offset:offset + self.parent_degrees[node_index]]
         else:
-            return set()
+            return array('i')
 
     def node_count(self):
-        return len(self.graph)
+        return len(self.offsets)
+
+    def get_memory_usage(self):
+        # Байты, занятые массивами графа вместе с их резервом
+        return sum(sys.getsizeof(items) for items in (
+            self.offsets, self.degrees, self.children, self.parent_offsets, self.parent_degrees, self.parents))
+
+    def __reserve(self, node_index):
+        missing = node_index + 1 - len(self.offsets)
+        if missing > 0:
+            zeros = array('i', bytes(missing * self.offsets.itemsize))
+            self.offsets.extend(zeros)
+            self.degrees.extend(zeros)
+            self.parent_offsets.extend(zeros)
+            self.parent_degrees.extend(zeros)
+
+    @staticmethod
+    def __append(offsets: array, degrees: array, items: array, node_index, item):
+        offset = offsets[node_index]
+        degree = degrees[node_index]
+        for position in range(offset, offset + degree):
+            if items[position] == item:
+                return False
+        # Дописать можно только блок в конце массива, иначе блок переносится в конец.
+        # Потомки узла добавляются подряд, поэтому для них переносов почти не бывает
+        if offset + degree != len(items):
+            offsets[node_index] = len(items)
+            items.extend(items[offset:offset + degree])
+        items.append(item)
+        degrees[node_index] = degree + 1
+        return True
+
+    @staticmethod
+    def __discard(offsets: array, degrees: array, items: array, node_index, item):
+        offset = offsets[node_index]
+        end = offset + degrees[node_index]
+        for position in range(offset, end):
+            if items[position] == item:
+                items[position:end - 1] = items[position + 1:end]
+                degrees[node_index] -= 1
+                return
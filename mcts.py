@@ -0,0 +1,263 @@
+import math
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from game_state import BoardGeometry, CellState, DeskState, get_geometry
+from players import Player, PlayerType, SearchCancelled
+from search_stats import SearchStats
+
+# Коэффициент исследования UCT: чем он больше, тем чаще пробуются ходы с малым числом проходов
+EXPLORATION = 1.4
+
+
+class MCTSNode:
+    # Позиция узла - маски фишек того, кто ходит в ней (own), и его противника. Победы узла считаются
+    # для игрока, сделавшего ход в этот узел, - именно он выбирает между узлом и его соседями
+    def __init__(self, geometry: BoardGeometry, own: int, opponent: int, passed: bool, move: int, parent):
+        self.own = own
+        self.opponent = opponent
+        self.passed = passed
+        # Клетка хода, которым получен узел, 0 - пропуск хода
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.visits = 0
+        self.wins = 0.0
+        self.depth = 0 if parent is None else parent.depth + 1
+        moves = geometry.get_moves(own, opponent)
+        self.untried_moves = []
+        while moves:
+            square = moves & -moves
+            moves ^= square
+            self.untried_moves.append(square)
+        # Пропуск хода возможен, только если противник не пропускал ход перед этим
+        if len(self.untried_moves) == 0 and not passed:
+            self.untried_moves.append(0)
+
+    def expand(self, geometry: BoardGeometry, move: int):
+        if move == 0:
+            child = MCTSNode(geometry, self.opponent, self.own, True, move, self)
+        else:
+            flipped = geometry.get_flips(move, self.own, self.opponent)
+            child = MCTSNode(geometry, self.opponent & ~flipped, self.own | move | flipped, False, move, self)
+        self.children.append(child)
+        return child
+
+
+def _choose_square(moves: int, random_generator: random.Random):
+    for i in range(random_generator.randrange(moves.bit_count())):
+        moves &= moves - 1
+    return moves & -moves
+
+
+def _playout(geometry: BoardGeometry, own: int, opponent: int, passed: bool, random_generator: random.Random,
+             guided: bool):
+    # Случайная партия до конца прямо на масках. Результат - для игрока, который ходит в начальной
+    # позиции: 1 - победа, 0.5 - ничья, 0 - поражение. С guided угол, если он доступен, занимается сразу
+    is_first_player_next = True
+    while True:
+        moves = geometry.get_moves(own, opponent)
+        if moves:
+            if guided and moves & geometry.corners:
+                moves &= geometry.corners
+            square = _choose_square(moves, random_generator)
+            flipped = geometry.get_flips(square, own, opponent)
+            own, opponent = opponent & ~flipped, own | square | flipped
+            passed = False
+        elif passed:
+            break
+        else:
+            own, opponent = opponent, own
+            passed = True
+        is_first_player_next = not is_first_player_next
+
+    difference = own.bit_count() - opponent.bit_count()
+    if not is_first_player_next:
+        difference = -difference
+    if difference > 0:
+        return 1.0
+    elif difference < 0:
+        return 0.0
+    return 0.5
+
+
+def _search_subtree(state: DeskState, applied_cell_state: CellState, playouts: int, time_limit: float,
+                    exploration: float, guided: bool, seed: int):
+    # Независимый поиск процесса-исполнителя; родитель складывает проходы ходов из корня всех процессов
+    player = MCTSPlayer(applied_cell_state, playouts, time_limit, 1, exploration, guided, seed)
+    root = player.search(state)
+    return [(child.move, child.visits, child.wins) for child in root.children], player.stats
+
+
+class MCTSPlayer(Player):
+    def __init__(
+            self,
+            applied_cell_state: CellState,
+            playouts: int = None,
+            time_limit: float = None,
+            workers: int = 1,
+            exploration: float = EXPLORATION,
+            guided: bool = True,
+            seed: int = None
+    ):
+        super(MCTSPlayer, self).__init__(applied_cell_state, PlayerType.MCTS_BOT)
+        # Бюджет хода - число случайных партий (playouts) и/или время в секундах
+        if playouts is None and time_limit is None:
+            playouts = 1000
+        self.playout_limit = playouts
+        self.time_limit = time_limit
+        # При workers > 1 каждый процесс строит своё дерево из корня с тем же бюджетом
+        if workers is None:
+            workers = os.cpu_count()
+        self.workers = workers
+        self.exploration = exploration
+        self.guided = guided
+        self.random_generator = random.Random(seed)
+        self.executor = None
+        self.cancelled = False
+        # Итоги последнего хода: число партий (растёт во время поиска), их скорость
+        # и доля побед выбранного хода
+        self.stats = SearchStats()
+        self.playouts = 0
+        self.playouts_per_second = 0.0
+        self.win_rate = None
+
+    def retry(self):
+        self.cancelled = False
+        self.stats = SearchStats()
+        self.playouts = 0
+        self.playouts_per_second = 0.0
+        self.win_rate = None
+
+    def cancel(self):
+        self.cancelled = True
+
+    def choose_next(self, current_state: DeskState):
+        started = time.perf_counter()
+        self.stats = SearchStats()
+        self.playouts = 0
+        self.playouts_per_second = 0.0
+        self.win_rate = None
+        following_states = current_state.get_following_states()[0]
+        # Пропуск хода, после которого ходить некому, - конец партии, как и в GameTree
+        if len(following_states) == 1 and following_states[0].passed_last_move and \
+                len(following_states[0].get_following_states()[0]) == 0:
+            following_states = []
+        if len(following_states) == 0:
+            return None
+        if len(following_states) == 1:
+            return following_states[0]
+
+        if self.workers > 1:
+            move_statistics = self.__search_in_parallel(current_state)
+        else:
+            root = self.search(current_state)
+            move_statistics = [(child.move, child.visits, child.wins) for child in root.children]
+
+        move, visits, wins = max(move_statistics, key=lambda statistics: statistics[1])
+        self.win_rate = wins / visits
+        self.stats.total_time = time.perf_counter() - started
+        if self.stats.total_time > 0:
+            self.playouts_per_second = self.playouts / self.stats.total_time
+        for following_state in following_states:
+            if following_state.last_move == move:
+                return following_state
+        return following_states[0]
+
+    def search(self, current_state: DeskState):
+        geometry = get_geometry(current_state.size)
+        if current_state.next_cell_state == CellState.BLACK:
+            own, opponent = current_state.black, current_state.white
+        else:
+            own, opponent = current_state.white, current_state.black
+        root = MCTSNode(geometry, own, opponent, current_state.passed_last_move, 0, None)
+        deadline = None
+        if self.time_limit is not None:
+            deadline = time.perf_counter() + self.time_limit
+
+        # Хотя бы одна партия проводится при любом бюджете, иначе у корня не будет ни одного хода
+        while self.playouts == 0 or (self.playout_limit is None or self.playouts < self.playout_limit) and \
+                (deadline is None or time.perf_counter() < deadline):
+            if self.cancelled:
+                raise SearchCancelled()
+            # Спуск по дереву выбором UCT, пока у узла не останется непробованных ходов
+            node = root
+            while len(node.untried_moves) == 0 and len(node.children) > 0:
+                node = self.__select_child(node)
+                self.stats.nodes_visited += 1
+            if len(node.untried_moves) > 0:
+                move = node.untried_moves.pop(self.random_generator.randrange(len(node.untried_moves)))
+                node = node.expand(geometry, move)
+                self.stats.nodes_generated += 1
+                self.stats.depth = max(self.stats.depth, node.depth)
+            score = _playout(geometry, node.own, node.opponent, node.passed, self.random_generator, self.guided)
+            self.playouts += 1
+            self.stats.leaves += 1
+            # Результат для ходящего в узле; победы узла - для его противника, и так через уровень
+            while node is not None:
+                node.visits += 1
+                node.wins += 1 - score
+                score = 1 - score
+                node = node.parent
+        return root
+
+    def __select_child(self, node: MCTSNode):
+        log_visits = math.log(node.visits)
+        return max(node.children, key=lambda child: child.wins / child.visits +
+                   self.exploration * math.sqrt(log_visits / child.visits))
+
+    def __search_in_parallel(self, current_state: DeskState):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers)
+        playouts = None
+        if self.playout_limit is not None:
+            playouts = max(1, self.playout_limit // self.workers)
+        futures = [
+            self.executor.submit(_search_subtree, current_state, self.applied_cell_state, playouts, self.time_limit,
+                                 self.exploration, self.guided, self.random_generator.getrandbits(32))
+            for i in range(self.workers)
+        ]
+        # Ожидание с проверкой отмены; отменённые процессы доигрывают свой бюджет впустую
+        pending = set(futures)
+        while pending:
+            if self.cancelled:
+                for future in pending:
+                    future.cancel()
+                raise SearchCancelled()
+            done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+
+        move_statistics = {}
+        for future in futures:
+            children, stats = future.result()
+            for move, visits, wins in children:
+                total_visits, total_wins = move_statistics.get(move, (0, 0.0))
+                move_statistics[move] = (total_visits + visits, total_wins + wins)
+            self.playouts += stats.leaves
+            self.stats.add(stats)
+            self.stats.depth = max(self.stats.depth, stats.depth)
+        return [(move, visits, wins) for move, (visits, wins) in move_statistics.items()]
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+
+def measure_playout_rate(sizes, worker_counts, time_limit: float = 2.0):
+    # Число случайных партий в секунду из начальной позиции для каждого размера доски и числа процессов
+    results = []
+    for size in sizes:
+        state = DeskState(True, size=size)
+        for workers in worker_counts:
+            player = MCTSPlayer(CellState.BLACK, time_limit=time_limit, workers=workers, seed=size)
+            player.choose_next(state)
+            player.close()
+            results.append((size, workers, player.playouts, player.playouts_per_second, player.stats.depth))
+    return results
+
+
+if __name__ == "__main__":
+    print('size workers playouts playouts_per_s tree_depth')
+    for result in measure_playout_rate((4, 6, 8), sorted({1, os.cpu_count()})):
+        print('%4d %7d %8d %14.0f %10d' % result)
@@ -0,0 +1,62 @@
+from game_state import BoardGeometry, CellState, DeskState, get_geometry
+
+
+def get_static_score(geometry: BoardGeometry, move: int):
+    # Статический порядок: углы не могут быть перевёрнуты и проверяются первыми, затем края
+    if move & geometry.corners:
+        return 2
+    elif move & geometry.edges:
+        return 1
+    return 0
+
+
+class MoveOrdering:
+    def __init__(self):
+        # Киллер-ходы: по два хода на каждый уровень дерева, вызвавшие отсечение
+        self.killers = {}
+        # История: суммарный вес отсечений, вызванных ходом в клетку, отдельно для каждого цвета
+        self.history = {CellState.BLACK: {}, CellState.WHITE: {}}
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def new_search(self):
+        self.killers = {}
+        for history in self.history.values():
+            for move in history:
+                history[move] //= 2
+
+    def order(self, nodes: list[DeskState], indexes, state: DeskState, best_move: int):
+        killers = self.killers.get(state.depth, ())
+        history = self.history[state.next_cell_state]
+        geometry = get_geometry(state.size)
+
+        def get_priority(index):
+            move = nodes[index].last_move
+            return (
+                move == best_move and move != 0,
+                move in killers,
+                history.get(move, 0),
+                get_static_score(geometry, move)
+            )
+
+        return sorted(indexes, key=get_priority, reverse=True)
+
+    def register_cutoff(self, move: int, depth: int, remaining_depth: int, cell_state: CellState, is_first: bool):
+        self.cutoffs += 1
+        if is_first:
+            self.first_move_cutoffs += 1
+        if move == 0:
+            return
+
+        killers = self.killers.setdefault(depth, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+
+        history = self.history[cell_state]
+        history[move] = history.get(move, 0) + remaining_depth * remaining_depth
+
+    def get_first_move_cutoff_rate(self):
+        if self.cutoffs == 0:
+            return 0
+        return self.first_move_cutoffs / self.cutoffs
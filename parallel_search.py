@@ -0,0 +1,217 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from game_state import CellState, DeskState
+from game_tree import GameTree
+from players import AlphaBetaPlayer, SearchTimeout
+from search_stats import SearchStats
+from symmetry import is_symmetric
+
+# Состояние процесса-исполнителя: общая нижняя граница оценки корня и игроки по цветам
+_shared_alpha = None
+_worker_players = {}
+
+
+def _init_worker(shared_alpha):
+    global _shared_alpha
+    _shared_alpha = shared_alpha
+
+
+def _estimate_subtree(
+        state: DeskState,
+        applied_cell_state: CellState,
+        depth: int,
+        transposition_table_size: int,
+        time_left: float,
+        table_epoch: int = 0,
+        search_id: int = 0
+):
+    key = (applied_cell_state, transposition_table_size)
+    if key not in _worker_players:
+        _worker_players[key] = AlphaBetaPlayer(applied_cell_state, depth, transposition_table_size=transposition_table_size)
+        _worker_players[key].table_epoch = table_epoch
+        _worker_players[key].search_id = None
+    player = _worker_players[key]
+    # Игрок-родитель очистил свою таблицу транспозиций - таблицы процессов очищаются вслед за ней
+    if player.table_epoch != table_epoch:
+        player.table_epoch = table_epoch
+        if player.transpositions is not None:
+            player.transpositions.clear()
+    # Новый поиск родителя - новое поколение таблицы (старые записи вытесняются первыми),
+    # сброс убийц и ослабление истории, как в choose_next последовательного игрока
+    if player.search_id != search_id:
+        player.search_id = search_id
+        if player.transpositions is not None:
+            player.transpositions.new_search()
+        if player.move_ordering is not None:
+            player.move_ordering.new_search()
+
+    player.symmetric_search = player.use_symmetry and is_symmetric(state)
+    if player.transpositions is not None:
+        player.transpositions.use_symmetry = player.symmetric_search
+    player.tree = GameTree(depth, state, True, player.symmetric_search)
+    player.estimates = [None]
+    player.stats = SearchStats()
+    player.horizon_reached = False
+    if time_left is not None:
+        player.deadline = time.perf_counter() + time_left
+    # Альфа поддерева - лучшая оценка корня, уже найденная любым процессом. Она берётся только здесь:
+    # если поднимать её внутри поиска, потомок получит окно уже, чем у родителя, и родитель запишет
+    # в таблицу транспозиций верхнюю границу как точную оценку
+    try:
+        estimate = player.estimate_state(player.tree.root_index, _shared_alpha.value, float('inf'))
+    finally:
+        player.deadline = None
+
+    with _shared_alpha.get_lock():
+        if estimate > _shared_alpha.value:
+            _shared_alpha.value = estimate
+    player.stats.nodes_generated = len(player.tree.nodes)
+    return estimate, player.stats, player.horizon_reached
+
+
+class ParallelAlphaBetaPlayer(AlphaBetaPlayer):
+    # Ходы из корня распределяются между процессами, остальное дерево каждый процесс строит сам
+    def __init__(
+            self,
+            applied_cell_state: CellState,
+            estimated_depth: int,
+            workers: int = None,
+            build_full_tree: bool = False,
+            transposition_table_size: int = 1 << 16,
+            time_limit: float = None
+    ):
+        super(ParallelAlphaBetaPlayer, self).__init__(
+            applied_cell_state,
+            estimated_depth,
+            build_full_tree,
+            transposition_table_size,
+            time_limit
+        )
+        # Таблица транспозиций у каждого процесса своя, того же размера
+        self.transposition_table_size = transposition_table_size
+        if workers is None:
+            workers = os.cpu_count()
+        self.workers = workers
+        self.worker_nodes = 0
+        self.table_epoch = 0
+        self.search_id = 0
+        self.shared_alpha = multiprocessing.Value('d', float('-inf'))
+        self.executor = None
+
+    def estimate_root(self):
+        root_index = self.tree.root_index
+        related_states = self.tree.get_children(root_index)
+        # Корень - узел максимума, если ходит сам игрок; иначе поиск идёт обычным способом
+        if len(related_states) == 0 or self.tree.nodes[root_index].next_cell_state != self.applied_cell_state:
+            super(ParallelAlphaBetaPlayer, self).estimate_root()
+            return
+
+        self.stats.nodes_visited += 1
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.shared_alpha,))
+        if len(self.estimates) < len(self.tree.nodes):
+            self.estimates.extend([None] * (len(self.tree.nodes) - len(self.estimates)))
+        time_left = None
+        if self.deadline is not None:
+            time_left = self.deadline - time.perf_counter()
+        self.shared_alpha.value = float('-inf')
+        self.search_id += 1
+
+        futures = {}
+        for related_state_index in related_states:
+            related_state = self.tree.nodes[related_state_index]
+            futures[related_state_index] = self.executor.submit(
+                _estimate_subtree,
+                related_state,
+                self.applied_cell_state,
+                self.tree.move_number - related_state.depth,
+                self.transposition_table_size,
+                time_left,
+                self.table_epoch,
+                self.search_id
+            )
+
+        estimate = float('-inf')
+        self.worker_nodes = 0
+        for related_state_index, future in futures.items():
+            related_state = self.tree.nodes[related_state_index]
+            try:
+                related_state_estimate, stats, horizon_reached = future.result()
+            except SearchTimeout:
+                for other_future in futures.values():
+                    other_future.cancel()
+                raise
+            self.estimates[related_state_index] = related_state_estimate
+            self.worker_nodes += stats.nodes_generated
+            # Без этого итеративное углубление остановилось бы после первой глубины
+            self.horizon_reached = self.horizon_reached or horizon_reached
+            self.stats.add(stats, related_state.depth)
+            estimate = max(estimate, related_state_estimate)
+        self.estimates[root_index] = estimate
+
+    def clear_transpositions(self):
+        if self.transpositions is not None:
+            self.transpositions.clear()
+        self.table_epoch += 1
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+
+def measure_speedup(depths, worker_counts, games: int = 10):
+    # Позиции из партий бота глубины 2 против самого себя, одинаковые для всех замеров
+    positions = []
+    for game_number in range(games):
+        state = DeskState(True)
+        players = {CellState.BLACK: AlphaBetaPlayer(CellState.BLACK, 2), CellState.WHITE: AlphaBetaPlayer(CellState.WHITE, 2)}
+        while state is not None:
+            positions.append(state)
+            state = players[state.next_cell_state].choose_next(state)
+
+    # Таблицы транспозиций очищаются перед каждой позицией с обеих сторон: записи более глубоких поисков
+    # прошлых позиций законно меняют оценки, и сравнение стало бы зависеть от истории таблиц
+    results = []
+    for depth in depths:
+        serial_players = {
+            CellState.BLACK: AlphaBetaPlayer(CellState.BLACK, depth),
+            CellState.WHITE: AlphaBetaPlayer(CellState.WHITE, depth)
+        }
+        started = time.perf_counter()
+        serial_estimates = []
+        for state in positions:
+            player = serial_players[state.next_cell_state]
+            player.retry()
+            player.transpositions.clear()
+            player.choose_next(state)
+            serial_estimates.append(player.estimates[player.tree.root_index] if player.tree.root_index >= 0 else None)
+        serial_time = time.perf_counter() - started
+
+        for workers in worker_counts:
+            parallel_players = {
+                CellState.BLACK: ParallelAlphaBetaPlayer(CellState.BLACK, depth, workers),
+                CellState.WHITE: ParallelAlphaBetaPlayer(CellState.WHITE, depth, workers)
+            }
+            started = time.perf_counter()
+            is_identical = True
+            for state, serial_estimate in zip(positions, serial_estimates):
+                player = parallel_players[state.next_cell_state]
+                player.retry()
+                player.clear_transpositions()
+                player.choose_next(state)
+                estimate = player.estimates[player.tree.root_index] if player.tree.root_index >= 0 else None
+                is_identical = is_identical and estimate == serial_estimate
+            parallel_time = time.perf_counter() - started
+            for player in parallel_players.values():
+                player.close()
+            results.append((depth, workers, serial_time, parallel_time, serial_time / parallel_time, is_identical))
+    return results
+
+
+if __name__ == "__main__":
+    print('depth workers serial_s parallel_s speedup identical')
+    for result in measure_speedup(range(4, 9), sorted({1, 2, os.cpu_count()})):
+        print('%5d %7d %8.3f %10.3f %7.2f %s' % result)
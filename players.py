@@ -1,12 +1,45 @@
 import random
+import time
 from enum import Enum
+from evaluation import get_evaluator
 from game_tree import GameTree
 from game_state import CellState, DeskState
+from move_ordering import MoveOrdering
+from search_stats import SearchStats
+from solver import PerfectPlayDatabase
+from symmetry import get_canonical_key, is_symmetric
+from transposition import Bound, TranspositionTable
 
 
 class PlayerType(Enum):
     ALPHA_BETA_BOT = 1
     PERSON = 2
+    MCTS_BOT = 3
+
+
+class SearchEngine(Enum):
+    # Алгоритм поиска AlphaBetaPlayer: обычный альфа-бета, поиск главного варианта (PVS)
+    # с окном стремления в корне или MTD(f) поверх альфа-беты с таблицей транспозиций
+    ALPHA_BETA = 1
+    PVS = 2
+    MTDF = 3
+
+
+# Полуширина окна стремления вокруг прошлой оценки корня (в фишках)
+ASPIRATION_WINDOW = 4
+
+# Обдумывание ограничено: дерево - не больше таблицы транспозиций (без таблицы - PONDER_NODE_LIMIT узлов),
+# время - PONDER_TIME_FACTOR ограничений времени хода. Больше просчитанное всё равно не удержать
+PONDER_NODE_LIMIT = 1 << 16
+PONDER_TIME_FACTOR = 4
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchCancelled(Exception):
+    pass
 
 
 class Player:
@@ -16,9 +49,68 @@ class Player:
 
 
 class AlphaBetaPlayer(Player):
-    def __init__(self, applied_cell_state: CellState, estimated_depth: int):
+    def __init__(
+            self,
+            applied_cell_state: CellState,
+            estimated_depth: int,
+            build_full_tree: bool = False,
+            transposition_table_size: int = 1 << 16,
+            time_limit: float = None,
+            order_moves: bool = True,
+            database: PerfectPlayDatabase = None,
+            stats_callback=None,
+            use_symmetry: bool = True,
+            engine: SearchEngine = SearchEngine.ALPHA_BETA,
+            use_patterns: bool = False
+    ):
         super(AlphaBetaPlayer, self).__init__(applied_cell_state, PlayerType.ALPHA_BETA_BOT)
         self.estimated_depth = estimated_depth
+        # Полное дерево нужно только для отображения всех позиций в TreeFrame,
+        # по умолчанию потомки строятся по мере обхода и отсечённые ветви не создаются
+        self.build_full_tree = build_full_tree
+        # Повороты и отражения позиции в дереве и таблице транспозиций считаются одной позицией.
+        # Это окупается, только если позиция хода сама симметрична (прежде всего начало партии),
+        # иначе равные с точностью до симметрии позиции в её дереве почти не встречаются
+        self.use_symmetry = use_symmetry
+        self.symmetric_search = False
+        # Таблица транспозиций живёт между ходами и партиями, retry её не очищает
+        if transposition_table_size > 0:
+            self.transpositions = TranspositionTable(transposition_table_size, use_symmetry)
+        else:
+            self.transpositions = None
+        if order_moves:
+            self.move_ordering = MoveOrdering()
+        else:
+            self.move_ordering = None
+        # С ограничением времени (в секундах) глубина наращивается 1, 2, 3... до estimated_depth,
+        # пока не истечёт время хода; выбирается ход последней полностью просчитанной глубины
+        self.time_limit = time_limit
+        self.deadline = None
+        # Предел числа узлов дерева, после которого поиск прерывается SearchTimeout (только при обдумывании)
+        self.node_limit = None
+        # Все алгоритмы дают одну и ту же оценку корня, различается число посещённых узлов
+        self.engine = engine
+        # Листья на границе глубины оцениваются таблицами образцов линий и подвижностью (evaluation.py),
+        # иначе - разностью фишек. Оценки в единицах таблиц, конец партии - разность фишек * FINAL_WEIGHT
+        self.use_patterns = use_patterns
+        self.reached_depth = 0
+        self.iteration_times = []
+        self.horizon_reached = False
+        # Позиции из базы идеальной игры (см. solver.py) не просчитываются, ход берётся из таблицы
+        self.database = database
+        # Счётчики последнего выбора хода; stats_callback, если задан, получает их после каждого хода
+        self.stats = SearchStats()
+        self.stats_callback = stats_callback
+        self.reused_nodes = 0
+        # Поиск может идти в другом потоке: cancel() прерывает его исключением SearchCancelled
+        # из choose_next, после чего игрока нужно сбросить через retry
+        self.cancelled = False
+        # Результат обдумывания хода соперника (ponder): ключи его ходов, глубина, до которой
+        # все они просчитаны, и затраченное время
+        self.pondered_keys = set()
+        self.pondered_depth = 0
+        self.ponder_time = 0.0
+        self.ponder_stats = SearchStats()
         self.tree = None
         self.player_choice = None
         self.estimates = [None]
@@ -27,55 +119,413 @@ class AlphaBetaPlayer(Player):
         self.tree = None
         self.player_choice = None
         self.estimates = [None]
+        self.stats = SearchStats()
+        self.cancelled = False
+        self.pondered_keys = set()
+        self.pondered_depth = 0
+        self.ponder_time = 0.0
+
+    def cancel(self):
+        self.cancelled = True
+
+    def ponder(self, current_state: DeskState):
+        # Обдумывание во время хода соперника (в current_state ходит он). Каждый его ход просчитывается
+        # как корень будущего поиска, глубина растёт, пока ход не сделан (cancel()) или не достигнута
+        # estimated_depth. Дерево и таблица транспозиций остаются игроку, и choose_next после хода
+        # соперника находит просчитанные позиции в них. Счётчики попадают в ponder_stats
+        started = time.perf_counter()
+        last_stats = self.stats
+        self.stats = SearchStats()
+        self.pondered_keys = set()
+        self.pondered_depth = 0
+        self.symmetric_search = self.use_symmetry and is_symmetric(current_state)
+        if self.transpositions is not None:
+            self.transpositions.use_symmetry = self.symmetric_search
+            self.transpositions.new_search()
+        if self.move_ordering is not None:
+            self.move_ordering.new_search()
+        if self.transpositions is not None:
+            self.node_limit = self.transpositions.capacity
+        else:
+            self.node_limit = PONDER_NODE_LIMIT
+        if self.time_limit is not None:
+            self.deadline = started + PONDER_TIME_FACTOR * self.time_limit
+        completed_estimates = None
+        try:
+            self.tree = GameTree(1, current_state, not self.build_full_tree, self.symmetric_search)
+            self.estimates = [None] * len(self.tree.nodes)
+            self.player_choice = None
+            if self.tree.root_index >= 0:
+                related_states = self.tree.get_children(self.tree.root_index)
+                self.pondered_keys = {get_canonical_key(self.tree.nodes[index])[0] for index in related_states}
+                for depth in range(1, self.estimated_depth + 1):
+                    self.stats.depth = depth
+                    self.tree.deepen(depth + 1)
+                    if self.build_full_tree:
+                        self.tree.expand_all()
+                    self.horizon_reached = False
+                    for related_state_index in related_states:
+                        self.estimate_state(related_state_index, float('-inf'), float('inf'))
+                    self.pondered_depth = depth
+                    completed_estimates = list(self.estimates)
+                    if not self.horizon_reached:
+                        break
+        except SearchTimeout:
+            # Недосчитанная глубина не должна смешаться с последней полной: её оценки откатываются
+            if completed_estimates is not None:
+                self.estimates = completed_estimates + [None] * (len(self.tree.nodes) - len(completed_estimates))
+            else:
+                self.pondered_keys = set()
+        except SearchCancelled:
+            self.cancelled = False
+        finally:
+            self.node_limit = None
+            self.deadline = None
+        self.ponder_time += time.perf_counter() - started
+        self.ponder_stats = self.stats
+        self.stats = last_stats
+
+    def __has_root_estimates(self):
+        # После reroot на дерево обдумывания у всех ходов из корня есть оценки (их могло не быть,
+        # если дерево построено заново или ход соперника взят из таблицы транспозиций без перебора)
+        if self.reused_nodes == 0 or self.tree.root_index < 0:
+            return False
+        related_nodes = self.tree.get_children(self.tree.root_index)
+        return len(related_nodes) > 0 and all(
+            index < len(self.estimates) and self.estimates[index] is not None for index in related_nodes)
+
+    def __get_pondered_depth(self, current_state: DeskState):
+        # Глубина, на которую позиция уже просчитана обдумыванием, 0 - если не просчитана
+        if get_canonical_key(current_state)[0] in self.pondered_keys:
+            return self.pondered_depth
+        return 0
 
     def choose_next(self, current_state: DeskState):
-        self.tree = GameTree(self.estimated_depth, current_state)
-        self.estimates = [None] * len(self.tree.nodes)
-        self.estimate_state(self.tree.root_index, float('-inf'), float('inf'))
-        best = self.__get_best()
-        self.player_choice = best
-        if best is not None:
-            return self.tree.nodes[best]
+        started = time.perf_counter()
+        self.stats = SearchStats()
+        self.reused_nodes = 0
+        pondered_depth = self.__get_pondered_depth(current_state)
+        self.symmetric_search = self.use_symmetry and is_symmetric(current_state)
+        if self.transpositions is not None:
+            self.transpositions.use_symmetry = self.symmetric_search
+            # Записи, найденные обдумыванием этого хода, остаются записями текущего поиска
+            if pondered_depth == 0:
+                self.transpositions.new_search()
+        if self.move_ordering is not None:
+            self.move_ordering.new_search()
+        if self.database is None or not self.__choose_from_database(current_state):
+            if self.time_limit is None:
+                self.stats.depth = self.estimated_depth
+                self.__prepare_tree(self.estimated_depth, current_state)
+                self.__estimate_tree()
+            else:
+                self.__estimate_iteratively(current_state, pondered_depth)
+                self.stats.depth = self.reached_depth
+        self.pondered_keys = set()
+        self.pondered_depth = 0
+        self.ponder_time = 0.0
+
+        if self.tree is not None:
+            self.stats.nodes_generated += len(self.tree.nodes) - self.reused_nodes
+        self.stats.total_time = time.perf_counter() - started
+        if self.stats_callback is not None:
+            self.stats_callback(self.stats)
+
+        if self.player_choice is not None:
+            return self.__get_real_state(current_state, self.tree.nodes[self.player_choice])
         else:
             return None
 
-    def estimate_state(self, state_index, alpha, beta):
-        related_states = self.tree.graph.get_related_nodes(state_index)
+    def __get_real_state(self, current_state: DeskState, chosen_state: DeskState):
+        # С симметриями корень и выбранный узел могут быть образами настоящих позиций:
+        # выбранный ход переводится на настоящую доску через равную ему каноническую форму
+        if not self.tree.use_symmetry:
+            return chosen_state
+        following_states = current_state.get_following_states()[0]
+        if chosen_state in following_states:
+            return chosen_state
+        chosen_key = get_canonical_key(chosen_state)[0]
+        for following_state in following_states:
+            if get_canonical_key(following_state)[0] == chosen_key:
+                return following_state
+        return chosen_state
 
-        if len(related_states) == 0:
-            black_count, white_count, empty_count = self.tree.nodes[state_index].get_cell_state_distribution()
+    def __prepare_tree(self, depth, current_state: DeskState):
+        started = time.perf_counter()
+        # Дерево прошлого хода уже содержит ответ соперника и всё, что под ним:
+        # его поддерево становится новым деревом, достраиваются только недостающие уровни
+        old_indexes = None
+        if self.tree is not None and self.tree.root_index >= 0 and self.tree.use_symmetry == self.symmetric_search:
+            old_indexes = self.tree.reroot(current_state, depth)
+        if old_indexes is not None:
+            self.reused_nodes = len(self.tree.nodes)
+            self.estimates = [
+                self.estimates[old_index] if old_index < len(self.estimates) else None
+                for old_index in old_indexes
+            ]
+            if self.build_full_tree:
+                self.tree.expand_all()
+        else:
+            self.tree = GameTree(depth, current_state, not self.build_full_tree, self.symmetric_search)
+            self.estimates = [None] * len(self.tree.nodes)
+        self.stats.build_time += time.perf_counter() - started
+
+    def __choose_from_database(self, current_state: DeskState):
+        result = self.database.lookup(current_state)
+        if result is None:
+            return False
+        value, best_move = result
+        # Дерево из корня и его потомков, чтобы TreeFrame показал точные оценки всех ходов
+        self.tree = GameTree(1, current_state, True)
+        self.estimates = [None] * len(self.tree.nodes)
+        self.player_choice = None
+        if self.tree.root_index < 0:
+            return True
+        self.__set_estimate(self.tree.root_index, self.database.get_value(current_state, self.applied_cell_state))
+        for related_state_index in self.tree.get_children(self.tree.root_index):
+            related_state = self.tree.nodes[related_state_index]
+            estimate = self.database.get_value(related_state, self.applied_cell_state)
+            if estimate is None:
+                # Пропуск хода, после которого партия окончена
+                estimate = self.__get_disc_difference(related_state)
+            self.__set_estimate(related_state_index, estimate)
+            if related_state.last_move == best_move:
+                self.player_choice = related_state_index
+        self.stats.depth = 1
+        return True
+
+    def __estimate_tree(self):
+        self.horizon_reached = False
+        if self.tree.root_index < 0:
+            self.player_choice = None
+            return
+        self.estimate_root()
+        self.player_choice = self.__get_best()
 
-            if self.applied_cell_state == CellState.BLACK:
-                estimate = black_count - white_count
+    def estimate_root(self):
+        if self.engine == SearchEngine.PVS:
+            self.__estimate_with_aspiration(self.tree.root_index)
+        elif self.engine == SearchEngine.MTDF:
+            self.__estimate_with_mtdf(self.tree.root_index)
+        else:
+            self.estimate_state(self.tree.root_index, float('-inf'), float('inf'))
+
+    def __get_root_guess(self, root_index):
+        # Оценка корня прошлой итерации углубления или прошлого хода (после reroot), если она есть
+        if root_index < len(self.estimates):
+            return self.estimates[root_index]
+        return None
+
+    def __estimate_with_aspiration(self, root_index):
+        # Окно вокруг прошлой оценки; если оценка вышла за окно, поиск повторяется с открытой стороной
+        guess = self.__get_root_guess(root_index)
+        if guess is None:
+            self.estimate_state(root_index, float('-inf'), float('inf'))
+            return
+        alpha = guess - ASPIRATION_WINDOW
+        beta = guess + ASPIRATION_WINDOW
+        while True:
+            estimate = self.estimate_state(root_index, alpha, beta)
+            if estimate <= alpha:
+                alpha = float('-inf')
+            elif estimate >= beta:
+                beta = float('inf')
             else:
-                estimate = white_count - black_count
-            self.estimates[state_index] = estimate
+                return
+
+    def __estimate_with_mtdf(self, root_index):
+        # Оценка сужается поисками с нулевым окном: каждый даёт верхнюю или нижнюю границу.
+        # Повторные проходы дёшевы за счёт таблицы транспозиций
+        estimate = self.__get_root_guess(root_index)
+        if estimate is None:
+            estimate = 0
+        lower = float('-inf')
+        upper = float('inf')
+        while lower < upper:
+            if estimate == lower:
+                beta = estimate + 1
+            else:
+                beta = estimate
+            estimate = self.estimate_state(root_index, beta - 1, beta)
+            if estimate < beta:
+                upper = estimate
+            else:
+                lower = estimate
+
+    def __estimate_iteratively(self, current_state: DeskState, pondered_depth: int = 0):
+        search_started = time.perf_counter()
+        self.deadline = None
+        self.reached_depth = 0
+        self.iteration_times = []
+        completed = (None, [None], None)
+        first_depth = 1
+        if pondered_depth > 0:
+            # Дерево обдумывания уже содержит оценки всех ходов на глубину pondered_depth: его лучший ход -
+            # запасной, и поиск глубже идёт с ограничением времени с первой же итерации.
+            # Время обдумывания засчитывается в время хода
+            self.__prepare_tree(pondered_depth, current_state)
+            if self.__has_root_estimates():
+                self.player_choice = self.__get_best()
+                completed = (self.tree, self.estimates, self.player_choice)
+                self.reached_depth = pondered_depth
+                first_depth = pondered_depth + 1
+                self.deadline = search_started + max(0.0, self.time_limit - self.ponder_time)
+        try:
+            for depth in range(first_depth, self.estimated_depth + 1):
+                started = time.perf_counter()
+                # Пока идёт поиск, stats.depth - текущая глубина, по его окончании - последняя завершённая
+                self.stats.depth = depth
+                # Дерево углубляется на месте, уже построенные узлы не пересоздаются
+                if depth == 1:
+                    self.__prepare_tree(depth, current_state)
+                else:
+                    self.tree.deepen(depth)
+                    if self.build_full_tree:
+                        self.tree.expand_all()
+                    self.estimates = list(self.estimates)
+                    self.stats.build_time += time.perf_counter() - started
+                self.__estimate_tree()
+                completed = (self.tree, self.estimates, self.player_choice)
+                self.reached_depth = depth
+                self.iteration_times.append(time.perf_counter() - started)
+                # Без обдумывания первая глубина просчитывается всегда, чтобы ход был выбран в любом случае
+                if self.deadline is None:
+                    self.deadline = search_started + self.time_limit
+                if not self.horizon_reached or self.deadline is not None and time.perf_counter() >= self.deadline:
+                    break
+        except SearchTimeout:
+            pass
+        self.deadline = None
+        self.tree, self.estimates, self.player_choice = completed
+
+    def estimate_state(self, state_index, alpha, beta):
+        if self.cancelled:
+            raise SearchCancelled()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+        if self.node_limit is not None and len(self.tree.nodes) > self.node_limit:
+            raise SearchTimeout()
+
+        state = self.tree.nodes[state_index]
+        remaining_depth = self.tree.move_number - state.depth
+        self.stats.nodes_visited += 1
+        best_move = 0
+        if self.transpositions is not None:
+            entry = self.transpositions.get(state)
+            if entry is not None:
+                best_move = self.transpositions.get_best_move(entry, state)
+            # В корне оценки потомков нужны для выбора хода, поэтому отсечение по таблице там не делаем
+            if entry is not None and entry.depth >= remaining_depth and state_index != self.tree.root_index:
+                if entry.bound == Bound.EXACT or \
+                        entry.bound == Bound.LOWER and entry.value >= beta or \
+                        entry.bound == Bound.UPPER and entry.value <= alpha:
+                    # Запись могла быть получена поиском, упёршимся в границу глубины
+                    self.horizon_reached = True
+                    self.stats.transposition_cutoffs += 1
+                    self.__set_estimate(state_index, entry.value)
+                    return entry.value
+
+        # В ленивом дереве потомки строятся здесь, это время относится к построению дерева
+        started = time.perf_counter()
+        related_states = self.tree.get_children(state_index)
+        self.stats.build_time += time.perf_counter() - started
+        if self.move_ordering is not None and len(related_states) > 1:
+            related_states = self.move_ordering.order(self.tree.nodes, related_states, state, best_move)
+
+        if len(related_states) == 0:
+            if remaining_depth <= 0:
+                self.horizon_reached = True
+            self.stats.leaves += 1
+            estimate = self.__evaluate(state)
+            self.__set_estimate(state_index, estimate)
             return estimate
 
-        if self.tree.nodes[state_index].next_cell_state == self.applied_cell_state:
+        initial_alpha, initial_beta = alpha, beta
+        best_state_index = None
+        if state.next_cell_state == self.applied_cell_state:
             estimate = float('-inf')
-            for related_state_index in related_states:
-                related_state_estimate = self.estimate_state(related_state_index, alpha, beta)
+            for position, related_state_index in enumerate(related_states):
+                related_state_estimate = self.__estimate_related_state(related_state_index, alpha, beta, position, True)
+                if related_state_estimate > estimate:
+                    best_state_index = related_state_index
                 estimate = max(estimate, related_state_estimate)
                 alpha = max(alpha, estimate)
                 if beta <= alpha:
+                    self.__register_cutoff(state, related_state_index, remaining_depth, position)
                     break
         else:
             estimate = float('inf')
-            for related_state_index in related_states:
-                related_state_estimate = self.estimate_state(related_state_index, alpha, beta)
+            for position, related_state_index in enumerate(related_states):
+                related_state_estimate = self.__estimate_related_state(related_state_index, alpha, beta, position, False)
+                if related_state_estimate < estimate:
+                    best_state_index = related_state_index
                 estimate = min(estimate, related_state_estimate)
                 beta = min(beta, estimate)
                 if beta <= alpha:
+                    self.__register_cutoff(state, related_state_index, remaining_depth, position)
                     break
 
-        self.estimates[state_index] = estimate
+        self.__set_estimate(state_index, estimate)
+        if self.transpositions is not None:
+            if estimate <= initial_alpha:
+                bound = Bound.UPPER
+            elif estimate >= initial_beta:
+                bound = Bound.LOWER
+            else:
+                bound = Bound.EXACT
+            best_move = self.tree.nodes[best_state_index].last_move
+            self.transpositions.put(state, remaining_depth, estimate, bound, best_move)
         return estimate
 
+    def __estimate_related_state(self, related_state_index, alpha, beta, position, is_maximizing):
+        # PVS: первый (лучший по порядку) потомок считается с полным окном, остальные - с нулевым окном
+        # у границы, и только потомок, оказавшийся внутри окна, пересчитывается с полным
+        if self.engine != SearchEngine.PVS or position == 0:
+            return self.estimate_state(related_state_index, alpha, beta)
+        if is_maximizing:
+            estimate = self.estimate_state(related_state_index, alpha, alpha + 1)
+        else:
+            estimate = self.estimate_state(related_state_index, beta - 1, beta)
+        if alpha < estimate < beta:
+            # Результат нулевого окна - граница оценки, она сужает окно повторного поиска
+            if is_maximizing:
+                estimate = self.estimate_state(related_state_index, estimate, beta)
+            else:
+                estimate = self.estimate_state(related_state_index, alpha, estimate)
+        return estimate
+
+    def __evaluate(self, state: DeskState):
+        if not self.use_patterns:
+            return self.__get_disc_difference(state)
+        estimate = get_evaluator(state.size).evaluate(state.black, state.white)
+        if self.applied_cell_state == CellState.BLACK:
+            return estimate
+        else:
+            return -estimate
+
+    def __get_disc_difference(self, state: DeskState):
+        black_count, white_count, empty_count = state.get_cell_state_distribution()
+        if self.applied_cell_state == CellState.BLACK:
+            return black_count - white_count
+        else:
+            return white_count - black_count
+
+    def __register_cutoff(self, state: DeskState, related_state_index, remaining_depth, position):
+        self.stats.add_cutoff(state.depth)
+        if self.move_ordering is not None:
+            move = self.tree.nodes[related_state_index].last_move
+            self.move_ordering.register_cutoff(move, state.depth, remaining_depth, state.next_cell_state, position == 0)
+
+    def __set_estimate(self, state_index, estimate):
+        # Ленивое дерево растёт во время поиска, список оценок догоняет его
+        if len(self.estimates) < len(self.tree.nodes):
+            self.estimates.extend([None] * (len(self.tree.nodes) - len(self.estimates)))
+        self.estimates[state_index] = estimate
+
     def __get_best(self):
         related_nodes = self.tree.graph.get_related_nodes(self.tree.root_index)
         max_array = []
-        maximal = -128
+        maximal = float('-inf')
         for node_index in related_nodes:
             node_estimate = self.estimates[node_index]
             if node_estimate > maximal:
@@ -109,7 +559,7 @@ class DecisionPlayer(Player):
                 False,
                 current_state.depth,
                 current_state.next_cell_state,
-                current_state.matrix
+                current_state
             )
         cell_coord, directions = decision
 
@@ -118,7 +568,7 @@ class DecisionPlayer(Player):
             False,
             current_state.depth,
             current_state.next_cell_state,
-            current_state.matrix,
+            current_state,
             cell_coord,
             directions
         )
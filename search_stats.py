@@ -0,0 +1,50 @@
+class SearchStats:
+    # Счётчики одного выбора хода (choose_next); глубина узла считается от корня дерева поиска
+    def __init__(self):
+        self.depth = 0
+        self.nodes_generated = 0
+        self.nodes_visited = 0
+        self.leaves = 0
+        self.cutoffs = {}
+        self.transposition_cutoffs = 0
+        self.build_time = 0.0
+        self.total_time = 0.0
+
+    def add_cutoff(self, depth: int):
+        self.cutoffs[depth] = self.cutoffs.get(depth, 0) + 1
+
+    def add(self, other: 'SearchStats', depth_offset: int = 0):
+        # Счётчики поиска поддерева, корень которого лежит на глубине depth_offset
+        self.nodes_generated += other.nodes_generated
+        self.nodes_visited += other.nodes_visited
+        self.leaves += other.leaves
+        for depth, count in other.cutoffs.items():
+            self.cutoffs[depth + depth_offset] = self.cutoffs.get(depth + depth_offset, 0) + count
+        self.transposition_cutoffs += other.transposition_cutoffs
+        self.build_time += other.build_time
+
+    def get_cutoff_count(self):
+        return sum(self.cutoffs.values())
+
+    def get_evaluation_time(self):
+        return max(0.0, self.total_time - self.build_time)
+
+    def get_effective_branching_factor(self):
+        # Такое ветвление на каждом уровне дало бы то же число посещённых узлов
+        if self.depth == 0 or self.nodes_visited <= 1:
+            return 0.0
+        return self.nodes_visited ** (1 / self.depth)
+
+    def to_dict(self):
+        return {
+            'depth': self.depth,
+            'nodes_generated': self.nodes_generated,
+            'nodes_visited': self.nodes_visited,
+            'leaves': self.leaves,
+            'cutoffs': {str(depth): count for depth, count in sorted(self.cutoffs.items())},
+            'transposition_cutoffs': self.transposition_cutoffs,
+            'effective_branching_factor': self.get_effective_branching_factor(),
+            'build_time': self.build_time,
+            'evaluation_time': self.get_evaluation_time(),
+            'total_time': self.total_time
+        }
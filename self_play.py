@@ -0,0 +1,239 @@
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from game import Game
+from game_state import CellState, DeskState
+from mcts import MCTSPlayer
+from players import AlphaBetaPlayer, SearchEngine
+from search_stats import SearchStats
+from solver import PerfectPlayDatabase
+
+try:
+    import numpy as np
+    import batch
+except ImportError:
+    # NumPy нужен только для пакетного режима (--batch-depth)
+    np = None
+    batch = None
+
+
+def parse_player(specification: str):
+    # Настройки бота строкой вида 'depth=5,time=0.5,tt=0,order=0,full=1,sym=0,db=reversi4x4.db,engine=pvs,eval=patterns'
+    # или 'mcts=1,playouts=2000,time=1,procs=4' для MCTSPlayer
+    options = {'depth': 3}
+    for option in specification.split(','):
+        if option:
+            name, value = option.split('=', 1)
+            options[name.strip()] = value.strip()
+    unknown = set(options) - {'depth', 'time', 'tt', 'order', 'full', 'sym', 'db', 'engine', 'eval', 'mcts', 'playouts', 'procs'}
+    if unknown:
+        raise ValueError('Unknown player options: ' + ', '.join(sorted(unknown)))
+    return options
+
+
+def create_player(options, applied_cell_state: CellState):
+    if options.get('mcts', '0') != '0':
+        return MCTSPlayer(
+            applied_cell_state,
+            int(options['playouts']) if 'playouts' in options else None,
+            float(options['time']) if 'time' in options else None,
+            int(options.get('procs', 1)),
+            # Зерно берётся из общего генератора, который play_game инициализирует seed + game_number,
+            # поэтому --seed воспроизводит и партии MCTS
+            seed=random.getrandbits(32)
+        )
+    kwargs = {}
+    if 'time' in options:
+        kwargs['time_limit'] = float(options['time'])
+    if 'tt' in options:
+        kwargs['transposition_table_size'] = int(options['tt'])
+    if 'order' in options:
+        kwargs['order_moves'] = options['order'] != '0'
+    if 'full' in options:
+        kwargs['build_full_tree'] = options['full'] != '0'
+    if 'sym' in options:
+        kwargs['use_symmetry'] = options['sym'] != '0'
+    if 'db' in options:
+        kwargs['database'] = PerfectPlayDatabase(options['db'])
+    if 'engine' in options:
+        kwargs['engine'] = SearchEngine[options['engine'].upper()]
+    if 'eval' in options:
+        if options['eval'] not in ('discs', 'patterns'):
+            raise ValueError('Unknown evaluation: ' + options['eval'])
+        kwargs['use_patterns'] = options['eval'] == 'patterns'
+    return AlphaBetaPlayer(applied_cell_state, int(options['depth']), **kwargs)
+
+
+def play_game(game_number: int, first, second, size: int, swap: bool, seed: int):
+    # При swap игроки меняются цветами в каждой второй партии
+    if swap and game_number % 2 == 1:
+        first, second = second, first
+        labels = ('second', 'first')
+    else:
+        labels = ('first', 'second')
+    if seed is not None:
+        random.seed(seed + game_number)
+
+    game = Game(create_player(first, CellState.BLACK), create_player(second, CellState.WHITE), size)
+    players = {CellState.BLACK: game.first_player, CellState.WHITE: game.second_player}
+    move_times = []
+    nodes = 0
+    started = time.perf_counter()
+    while not game.is_finished:
+        player = players[game.next_cell_state_to_apply]
+        move_started = time.perf_counter()
+        game.next()
+        move_times.append(time.perf_counter() - move_started)
+        nodes += player.stats.nodes_generated
+    duration = time.perf_counter() - started
+
+    # Последний вызов next не находит хода, итоговая позиция - предыдущая
+    move_times.pop()
+    final_state = game.prev_state
+    black_count, white_count, empty_count = final_state.get_cell_state_distribution()
+    if black_count > white_count:
+        winner = labels[0]
+    elif white_count > black_count:
+        winner = labels[1]
+    else:
+        winner = 'draw'
+    return {
+        'game': game_number,
+        'black': labels[0],
+        'white': labels[1],
+        'winner': winner,
+        'black_discs': black_count,
+        'white_discs': white_count,
+        'plies': len(move_times),
+        'move_times': [round(move_time, 6) for move_time in move_times],
+        'nodes': nodes,
+        'time': round(duration, 6)
+    }
+
+
+def _play_game(arguments):
+    return play_game(*arguments)
+
+
+def run(games: int, first, second, size: int = 4, workers: int = None, swap: bool = False, seed: int = None,
+        output=None):
+    tasks = [(game_number, first, second, size, swap, seed) for game_number in range(games)]
+    summary = {'games': 0, 'first': 0, 'second': 0, 'draw': 0, 'plies': 0, 'nodes': 0}
+    started = time.perf_counter()
+    if workers == 1:
+        results = map(_play_game, tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(workers)
+        results = executor.map(_play_game, tasks, chunksize=max(1, games // (4 * (workers or os.cpu_count()))))
+    try:
+        # Результаты пишутся по мере готовности партий, по строке JSON на партию
+        for result in results:
+            if output is not None:
+                output.write(json.dumps(result) + '\n')
+                output.flush()
+            summary['games'] += 1
+            summary[result['winner']] += 1
+            summary['plies'] += result['plies']
+            summary['nodes'] += result['nodes']
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    duration = time.perf_counter() - started
+    summary['time'] = duration
+    summary['games_per_second'] = summary['games'] / duration
+    summary['nodes_per_second'] = summary['nodes'] / duration
+    return summary
+
+
+def run_batch(games: int, depth: int, size: int = 4, seed: int = None, output=None):
+    # Все партии идут одновременно: на каждом шаге ходы выбираются сразу для всех незаконченных партий
+    # полным минимаксом глубины depth (batch.py) за обе стороны. Время и узлы шага делятся поровну
+    # между партиями, сделавшими ход
+    if batch is None:
+        raise RuntimeError('NumPy is required for batched self-play')
+    random_generator = np.random.default_rng(seed)
+    boards = batch.BoardBatch.from_states([DeskState(True, size=size)] * games)
+    active = np.arange(games)
+    final_black = boards.black.copy()
+    final_white = boards.white.copy()
+    move_times = [[] for i in range(games)]
+    nodes = np.zeros(games)
+    stats = SearchStats()
+    started = time.perf_counter()
+    while len(active) > 0:
+        move_started = time.perf_counter()
+        nodes_before = stats.nodes_generated
+        indexes, boards = batch.choose_moves(boards, depth, random_generator, stats)
+        active = active[indexes]
+        if len(active) == 0:
+            break
+        final_black[active] = boards.black
+        final_white[active] = boards.white
+        move_time = (time.perf_counter() - move_started) / len(active)
+        for game_number in active:
+            move_times[game_number].append(round(move_time, 6))
+        nodes[active] += (stats.nodes_generated - nodes_before) / len(active)
+    duration = time.perf_counter() - started
+
+    summary = {'games': games, 'first': 0, 'second': 0, 'draw': 0, 'plies': 0, 'nodes': stats.nodes_generated}
+    black_counts = batch.count_bits(final_black)
+    white_counts = batch.count_bits(final_white)
+    for game_number in range(games):
+        black_count, white_count = int(black_counts[game_number]), int(white_counts[game_number])
+        if black_count > white_count:
+            winner = 'first'
+        elif white_count > black_count:
+            winner = 'second'
+        else:
+            winner = 'draw'
+        summary[winner] += 1
+        summary['plies'] += len(move_times[game_number])
+        if output is not None:
+            output.write(json.dumps({
+                'game': game_number,
+                'black': 'first',
+                'white': 'second',
+                'winner': winner,
+                'black_discs': black_count,
+                'white_discs': white_count,
+                'plies': len(move_times[game_number]),
+                'move_times': move_times[game_number],
+                'nodes': round(nodes[game_number]),
+                'time': round(sum(move_times[game_number]), 6)
+            }) + '\n')
+    summary['time'] = duration
+    summary['games_per_second'] = games / duration
+    summary['nodes_per_second'] = stats.nodes_generated / duration
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Headless Reversi self-play between two alpha-beta setups')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--first', default='depth=3', help="first player, e.g. 'depth=5,time=0.5,tt=0,order=0'")
+    parser.add_argument('--second', default='depth=3', help='second player, same format as --first')
+    parser.add_argument('--size', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=None, help='processes, 1 plays in this process')
+    parser.add_argument('--swap', action='store_true', help='swap colours every other game')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default=None, help='JSON lines file with one result per game')
+    parser.add_argument('--batch-depth', type=int, default=None,
+                        help='play all games at once with NumPy full-width search of this depth for both sides')
+    args = parser.parse_args()
+
+    output = open(args.output, 'w') if args.output is not None else None
+    try:
+        if args.batch_depth is not None:
+            summary = run_batch(args.games, args.batch_depth, args.size, args.seed, output)
+        else:
+            summary = run(args.games, parse_player(args.first), parse_player(args.second), args.size, args.workers,
+                          args.swap, args.seed, output)
+    finally:
+        if output is not None:
+            output.close()
+    print('games: {games}, first wins: {first}, second wins: {second}, draws: {draw}'.format(**summary))
+    print('time: {time:.2f}s, games/s: {games_per_second:.2f}, nodes/s: {nodes_per_second:.0f}'.format(**summary))
@@ -0,0 +1,145 @@
+import mmap
+import struct
+import sys
+import time
+from game_state import CellState, DeskState, SearchBoard
+from symmetry import get_canonical_key, get_symmetry
+
+DATABASE_PATH = 'reversi4x4.db'
+
+# Заголовок: сигнатура, версия, размер доски, log2 числа ячеек, число позиций.
+# Ячейка: каноническая форма позиции (см. symmetry.py, 0 - пустая ячейка), точный итог партии
+# для ходящей стороны и лучший ход в канонической позиции (индекс клетки, -1 - пропуск)
+_HEADER = struct.Struct('<4sBBBxI')
+_RECORD = struct.Struct('<Qbb2x')
+_MAGIC = b'RVDB'
+_VERSION = 2
+_PASS = -1
+_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+def _get_slot(key: int, slot_bits: int):
+    return ((key * _MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> (64 - slot_bits)
+
+
+class PerfectPlaySolver:
+    # Полный перебор всех позиций, достижимых из начальной; симметричные позиции считаются один раз.
+    # Значение позиции - разность фишек в конце партии при идеальной игре обеих сторон,
+    # со стороны игрока, который ходит в позиции
+    def __init__(self, size: int = 4):
+        # Ключ упаковывается в 64 бита, больше 5x5 не поместится (и не переберётся)
+        if 2 * size * size + 1 > 64:
+            raise ValueError('Board is too large for the perfect play database')
+        self.size = size
+        self.symmetry = get_symmetry(size)
+        self.solved = {}
+
+    def solve(self):
+        return self.__solve(SearchBoard(DeskState(True, size=self.size)))
+
+    def __solve(self, board: SearchBoard):
+        # Перебор идёт на одной доске ходом и его отменой, позиции DeskState не создаются
+        if board.white_next:
+            key = self.symmetry.get_key(board.opponent, board.own, CellState.WHITE)
+        else:
+            key = self.symmetry.get_key(board.own, board.opponent, CellState.BLACK)
+        key, transform = self.symmetry.get_canonical(key)
+        if key in self.solved:
+            return self.solved[key][0]
+
+        moves = board.get_moves()
+        best_move = _PASS
+        if moves == 0:
+            # Пропуск хода: если и сопернику некуда ходить, партия окончена
+            if board.passed_last_move or board.geometry.get_moves(board.opponent, board.own) == 0:
+                value = board.get_disc_difference()
+            else:
+                board.make(0)
+                value = -self.__solve(board)
+                board.unmake()
+        else:
+            value = None
+            best_square = 0
+            while moves:
+                square = moves & -moves
+                moves ^= square
+                board.make(square)
+                following_value = -self.__solve(board)
+                board.unmake()
+                if value is None or following_value > value:
+                    value = following_value
+                    best_square = square
+            # Ход хранится в координатах канонической позиции
+            best_move = self.symmetry.transform_square(best_square, transform).bit_length() - 1
+
+        self.solved[key] = (value, best_move)
+        return value
+
+    def save(self, path: str):
+        # Открытая адресация с линейным пробированием, заполнение не больше половины
+        slot_bits = 1
+        while (1 << slot_bits) < 2 * len(self.solved):
+            slot_bits += 1
+        slot_count = 1 << slot_bits
+        table = bytearray(_HEADER.size + slot_count * _RECORD.size)
+        _HEADER.pack_into(table, 0, _MAGIC, _VERSION, self.size, slot_bits, len(self.solved))
+        for key, (value, best_move) in self.solved.items():
+            slot = _get_slot(key, slot_bits)
+            while _RECORD.unpack_from(table, _HEADER.size + slot * _RECORD.size)[0] != 0:
+                slot = (slot + 1) & (slot_count - 1)
+            _RECORD.pack_into(table, _HEADER.size + slot * _RECORD.size, key, value, best_move)
+        with open(path, 'wb') as file:
+            file.write(table)
+
+
+class PerfectPlayDatabase:
+    # Файл не читается целиком, а отображается в память: поиск позиции - одна-две ячейки таблицы
+    def __init__(self, path: str = DATABASE_PATH):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size, self.slot_bits, self.position_count = _HEADER.unpack_from(self.data, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise ValueError('Unknown perfect play database format: ' + path)
+        self.slot_mask = (1 << self.slot_bits) - 1
+        self.symmetry = get_symmetry(self.size)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def lookup(self, state: DeskState):
+        # Возвращает (значение для ходящей стороны, клетка лучшего хода или 0 при пропуске) либо None
+        if state.size != self.size:
+            return None
+        key, transform = get_canonical_key(state)
+        slot = _get_slot(key, self.slot_bits)
+        while True:
+            stored_key, value, best_move = _RECORD.unpack_from(self.data, _HEADER.size + slot * _RECORD.size)
+            if stored_key == key:
+                if best_move == _PASS:
+                    return value, 0
+                return value, self.symmetry.restore_square(1 << best_move, transform)
+            if stored_key == 0:
+                return None
+            slot = (slot + 1) & self.slot_mask
+
+    def get_value(self, state: DeskState, cell_state: CellState):
+        # Значение позиции для игрока cell_state
+        result = self.lookup(state)
+        if result is None:
+            return None
+        if state.next_cell_state == cell_state:
+            return result[0]
+        return -result[0]
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else DATABASE_PATH
+    board_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    started = time.perf_counter()
+    solver = PerfectPlaySolver(board_size)
+    initial_value = solver.solve()
+    solver.save(path)
+    print('positions: {}, initial value: {}, time: {:.1f}s'.format(
+        len(solver.solved), initial_value, time.perf_counter() - started))
@@ -0,0 +1,107 @@
+from game_state import CellCoord, CellState, DeskState, get_geometry
+
+
+def _get_transformed_coord(cell_coord: CellCoord, transform: int, size: int):
+    # Восемь симметрий квадрата: четыре поворота и они же после отражения по горизонтали
+    x, y = cell_coord.x, cell_coord.y
+    if transform >= 4:
+        x = size - 1 - x
+    for i in range(transform % 4):
+        x, y = size - 1 - y, x
+    return CellCoord(x, y)
+
+
+class BoardSymmetry:
+    # Позиция упаковывается в одно число: черные, белые (сдвинуты на cell_count) и очередь хода
+    # (бит 2 * cell_count). Каноническая форма - наименьшее такое число среди образов позиции
+    def __init__(self, size: int):
+        geometry = get_geometry(size)
+        self.size = size
+        self.cell_count = geometry.cell_count
+        self.white_next = 1 << (2 * self.cell_count)
+        # Для каждой симметрии: клетка -> образ клетки и таблицы образов каждого байта
+        # упакованной позиции, чтобы преобразовать её за несколько обращений к таблице
+        self.square_maps = []
+        self.inverse_square_maps = []
+        self.byte_tables = []
+        for transform in range(8):
+            square_map = {}
+            for index in range(self.cell_count):
+                cell_coord = CellCoord(index % size, index // size)
+                square_map[1 << index] = geometry.get_square(_get_transformed_coord(cell_coord, transform, size))
+            self.square_maps.append(square_map)
+            self.inverse_square_maps.append({image: square for square, image in square_map.items()})
+
+            byte_tables = []
+            for shift in range(0, 2 * self.cell_count, 8):
+                byte_table = []
+                for byte in range(256):
+                    image = 0
+                    for bit in range(8):
+                        index = shift + bit
+                        if byte & (1 << bit) and index < 2 * self.cell_count:
+                            if index < self.cell_count:
+                                image |= square_map[1 << index]
+                            else:
+                                image |= square_map[1 << (index - self.cell_count)] << self.cell_count
+                    byte_table.append(image)
+                byte_tables.append(byte_table)
+            self.byte_tables.append(byte_tables)
+
+    def get_key(self, black: int, white: int, next_cell_state: CellState):
+        key = black | (white << self.cell_count)
+        if next_cell_state == CellState.WHITE:
+            key |= self.white_next
+        return key
+
+    def transform(self, key: int, transform: int):
+        image = key & self.white_next
+        for byte_table in self.byte_tables[transform]:
+            image |= byte_table[key & 255]
+            key >>= 8
+        return image
+
+    def get_canonical(self, key: int):
+        # Возвращает каноническую форму и симметрию, которая переводит позицию в неё
+        canonical = key
+        canonical_transform = 0
+        for transform in range(1, 8):
+            image = self.transform(key, transform)
+            if image < canonical:
+                canonical = image
+                canonical_transform = transform
+        return canonical, canonical_transform
+
+    def transform_square(self, square: int, transform: int):
+        if square == 0:
+            return 0
+        return self.square_maps[transform][square]
+
+    def restore_square(self, square: int, transform: int):
+        if square == 0:
+            return 0
+        return self.inverse_square_maps[transform][square]
+
+
+_symmetries = {}
+
+
+def get_symmetry(size: int):
+    if size not in _symmetries:
+        _symmetries[size] = BoardSymmetry(size)
+    return _symmetries[size]
+
+
+def get_canonical_key(state: DeskState):
+    # Каноническая форма считается один раз на позицию и хранится в ней самой
+    if state.canonical is None:
+        symmetry = get_symmetry(state.size)
+        state.canonical = symmetry.get_canonical(symmetry.get_key(state.black, state.white, state.next_cell_state))
+    return state.canonical
+
+
+def is_symmetric(state: DeskState):
+    # Позиция переходит в себя при каком-то повороте или отражении - в её дереве много равных позиций
+    symmetry = get_symmetry(state.size)
+    key = symmetry.get_key(state.black, state.white, state.next_cell_state)
+    return any(symmetry.transform(key, transform) == key for transform in range(1, 8))
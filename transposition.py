@@ -0,0 +1,97 @@
+from enum import Enum
+from game_state import DeskState
+from symmetry import get_canonical_key, get_symmetry
+
+
+class Bound(Enum):
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+
+class TranspositionEntry:
+    def __init__(self, key: int, depth: int, value, bound: Bound, best_move: int, generation: int):
+        self.key = key
+        self.depth = depth
+        self.value = value
+        self.bound = bound
+        self.best_move = best_move
+        self.generation = generation
+
+
+class TranspositionTable:
+    def __init__(self, capacity: int = 1 << 16, use_symmetry: bool = False):
+        self.capacity = capacity
+        # С симметриями позиция и её повороты и отражения делят одну запись,
+        # лучший ход хранится в координатах канонической формы
+        self.use_symmetry = use_symmetry
+        self.entries = [None] * capacity
+        # Номер поиска: записи прошлых ходов вытесняются в первую очередь
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def __locate(self, state: DeskState):
+        # Ключ записи (упакованная позиция), ячейка таблицы и симметрия к канонической форме
+        if self.use_symmetry:
+            key, transform = get_canonical_key(state)
+            return key, hash((key,)) % self.capacity, transform
+        key = get_symmetry(state.size).get_key(state.black, state.white, state.next_cell_state)
+        return key, state.hash % self.capacity, 0
+
+    def get(self, state: DeskState):
+        key, slot, transform = self.__locate(state)
+        entry = self.entries[slot]
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.key != key:
+            self.misses += 1
+            self.collisions += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def get_best_move(self, entry: TranspositionEntry, state: DeskState):
+        # Лучший ход записи в координатах позиции state
+        if self.use_symmetry:
+            return get_symmetry(state.size).restore_square(entry.best_move, get_canonical_key(state)[1])
+        return entry.best_move
+
+    def put(self, state: DeskState, depth: int, value, bound: Bound, best_move: int):
+        key, slot, transform = self.__locate(state)
+        if self.use_symmetry:
+            best_move = get_symmetry(state.size).transform_square(best_move, transform)
+        entry = self.entries[slot]
+        if entry is not None:
+            is_other_state = entry.key != key
+            if is_other_state:
+                self.collisions += 1
+            # Замещение по глубине: более глубокую запись текущего поиска не вытесняем,
+            # записи прошлых поисков заменяются всегда
+            if entry.generation == self.generation and entry.depth > depth:
+                return
+            if is_other_state:
+                self.replacements += 1
+        self.entries[slot] = TranspositionEntry(key, depth, value, bound, best_move, self.generation)
+        self.stores += 1
+
+    def clear(self):
+        self.entries = [None] * self.capacity
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def get_hit_rate(self):
+        probes = self.hits + self.misses
+        if probes == 0:
+            return 0
+        return self.hits / probes